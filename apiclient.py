@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+###################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+test_data_path = os.path.join(config['test_data_path'])
+model_path = os.path.join(config['output_model_path'])
+
+# url of the model API, timeout of a call in seconds and number of retries
+api_url = config.get('api_url', 'http://127.0.0.1:8000')
+api_timeout = config.get('api_timeout', 60)
+api_retries = config.get('api_retries', 3)
+
+
+def endpoints():
+    """API calls collected after a deployment: name -> (method, path, query parameters)"""
+    return {'Predictions': ('GET', '/prediction', {'filename': os.path.join(test_data_path, 'testdata.csv')}),
+            'Scoring': ('GET', '/scoring', None),
+            'Statistics': ('GET', '/summarystats', None),
+            'Diagnostics': ('GET', '/diagnostics', None)}
+
+
+###################Pooled http session
+def make_session(pool_size=10, retries=None):
+    """http session keeping connections open between calls
+    connection errors and 502/503/504 answers are retried with exponential backoff
+    """
+    retries = api_retries if retries is None else retries
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[502, 503, 504],
+                  allowed_methods=['GET', 'POST'], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def parse_response(response):
+    """decoded json body of a response, its text if it is not json"""
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+
+###################Concurrent API calls
+async def call(session, executor, url, method, path, params, timeout):
+    """call an endpoint without blocking the event loop
+    output: dict with status, elapsed seconds and decoded body, or the error
+    """
+    loop = asyncio.get_running_loop()
+    request = functools.partial(session.request, method, url + path, params=params, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        response = await loop.run_in_executor(executor, request)
+    except requests.RequestException as e:
+        return {'error': f'{type(e).__name__}: {e}', 'elapsed': time.perf_counter() - start}
+    return {'status': response.status_code,
+            'elapsed': time.perf_counter() - start,
+            'body': parse_response(response)}
+
+
+async def call_all(calls, url, timeout, retries):
+    """call all endpoints concurrently on one pooled session"""
+    with make_session(len(calls), retries) as session, \
+            ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        results = await asyncio.gather(*[call(session, executor, url, method, path, params, timeout)
+                                         for method, path, params in calls.values()])
+    return dict(zip(calls, results))
+
+
+def collect(url=None, timeout=None, retries=None, calls=None):
+    """
+    call the API endpoints concurrently, the total time is the one of the slowest call
+    input (optional): API url, timeout in seconds and number of retries per call,
+                      api_url, api_timeout and api_retries from config.json by default,
+                      and dict of calls, endpoints() by default
+    output: dict of responses keyed by call name
+    """
+    return asyncio.run(call_all(calls or endpoints(), url or api_url,
+                                timeout or api_timeout, retries))
+
+
+def write_returns(responses, filepath=None):
+    """write the collected responses as json to apireturns.txt"""
+    filepath = filepath or os.path.join(model_path, 'apireturns.txt')
+    with open(filepath + '.tmp', 'w') as f:
+        json.dump(responses, f, indent=1)
+    os.replace(filepath + '.tmp', filepath)
+    return filepath
+
+
+if __name__ == '__main__':
+    write_returns(collect())
@@ -1,9 +1,15 @@
-from flask import Flask, session, jsonify, request
+from flask import Flask, session, jsonify, request, Response, stream_with_context
 import pandas as pd
+import numpy as np
 
-import diagnostics, scoring, ingestion
+import diagnostics, scoring, ingestion, features, registry, batchprediction
+from jobs import manager, file_version
+from instrumentation import metrics_version
 import json
+import io
 import os
+import time
+import tempfile
 
 
 ######################Set up variables for use in our script
@@ -14,9 +20,106 @@ with open('config.json','r') as f:
     config = json.load(f) 
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
+test_data_path = os.path.join(config['test_data_path'])
+model_path = os.path.join(config['output_model_path'])
+
+# seconds a GET request waits for a background job before answering 202
+job_wait_timeout = config.get('job_wait_timeout', 30)
+# seconds a diagnostics result is reused, bounds the age of its dependency audit
+dependency_cache_ttl = config.get('dependency_cache_ttl', 3600)
 
 prediction_model = None
 
+# predictors expected by the model, in training order
+predictors = features.PREDICTORS
+
+
+def parse_feature_rows(req):
+    """read a batch of feature rows from a request body
+    accepted bodies:
+    - application/json: {"data": [[...], ...]} with optional "columns",
+      or a list of {feature: value} objects
+    - application/octet-stream: raw little-endian float64 values, row-major
+    - application/x-npy: a serialized numpy array
+    output: float64 array of shape (n_rows, n_predictors)
+    """
+    if req.mimetype == 'application/octet-stream':
+        body = req.get_data()
+        if len(body) % (8 * len(predictors)):
+            raise ValueError(f'binary body must hold rows of {len(predictors)} float64 values')
+        return np.frombuffer(body, dtype='<f8').reshape(-1, len(predictors))
+
+    if req.mimetype == 'application/x-npy':
+        X = np.load(io.BytesIO(req.get_data()), allow_pickle=False)
+        columns = predictors
+    else:
+        payload = req.get_json(force=True, silent=True)
+        if isinstance(payload, list):
+            columns = predictors
+            X = [[row[col] for col in predictors] for row in payload]
+        elif isinstance(payload, dict) and 'data' in payload:
+            columns = payload.get('columns', predictors)
+            X = payload['data']
+        else:
+            raise ValueError('expected a JSON list of rows or an object with a "data" key')
+
+    if list(columns) != predictors and sorted(columns) != sorted(predictors):
+        raise ValueError(f'columns must be {predictors}')
+
+    # shape is checked before columns are reordered
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != len(predictors):
+        raise ValueError(f'each row must hold {len(predictors)} values: {predictors}')
+    if list(columns) != predictors:
+        X = X[:, [list(columns).index(col) for col in predictors]]
+    return X
+
+
+def job_response(job, wait=0):
+    """json response for a background job, waiting at most wait seconds for it
+    200 with the job and its result once done, 202 while it runs, 500 if it failed
+    """
+    job.wait(wait)
+    body = job.to_dict()
+    if job.status == 'done':
+        return jsonify(body), 200
+    if job.status == 'error':
+        return jsonify(body), 500
+    return jsonify(body), 202, {'Location': f'/jobs/{job.id}'}
+
+
+def wait_parameter():
+    """seconds to wait for a job, from the wait query parameter"""
+    try:
+        return min(max(float(request.args.get('wait', 0)), 0), job_wait_timeout)
+    except ValueError:
+        return 0
+
+
+def warm_caches():
+    """load the deployed model and cached reference data into the process caches
+    called in the gunicorn master before workers are forked (see gunicorn.conf.py),
+    so that workers share these objects copy-on-write instead of loading their own
+    background jobs are not started here: threads do not survive a fork
+    """
+    for warm in [diagnostics.deployed_model, diagnostics.summary_statistics,
+                 diagnostics.outdated_packages_list]:
+        try:
+            warm()
+        except (OSError, ValueError):
+            # nothing deployed or ingested yet, workers load it on first use
+            pass
+
+
+def iter_uploaded_predictions(filepath, chunksize=None):
+    """stream the predictions of an uploaded csv file saved to a temporary file,
+    so that the upload is never held in memory; the file is removed afterwards
+    """
+    try:
+        yield from batchprediction.iter_csv_predictions(filepath, chunksize)
+    finally:
+        os.remove(filepath)
+
 
 #######################Scoring Endpoint
 @app.route("/")
@@ -28,6 +131,32 @@ def greetings():
 @app.route("/prediction", methods=['POST','GET','OPTIONS'])
 def predict():        
     #call the prediction function you created in Step 3
+    #with ?stream=true, the file is read and scored chunk by chunk and the
+    #predictions are returned as a chunked csv response with bounded memory
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        #the input is checked before streaming: errors after the first chunk
+        #would reach the client as a truncated 200 response
+        chunksize = request.args.get('chunksize', type=int)
+        if request.method == 'POST':
+            if 'filename' not in request.files:
+                return jsonify({'error': "missing 'filename' file part"}), 400
+            filepath = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
+            request.files['filename'].save(filepath)
+            try:
+                batchprediction.check_input(filepath, request.files['filename'].filename)
+            except ValueError as e:
+                os.remove(filepath)
+                return jsonify({'error': str(e)}), 400
+            predictions = iter_uploaded_predictions(filepath, chunksize)
+        else:
+            filename = request.args.get('filename')
+            try:
+                batchprediction.check_input(filename)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            predictions = batchprediction.iter_csv_predictions(filename, chunksize)
+        return Response(stream_with_context(batchprediction.iter_with_error_record(predictions)),
+                        mimetype='text/csv')
     if request.method == 'POST':
         file = request.files['filename']
         dataset = ingestion.read_csv(file)
@@ -37,43 +166,97 @@ def predict():
         dataset = ingestion.read_csv(file)
         return {'predictions': str(diagnostics.model_predictions(dataset))}
 
+#######################Batch Prediction Endpoint
+@app.route("/v2/predict", methods=['POST'])
+def predict_batch():
+    #score a batch of feature rows without going through a csv file
+    try:
+        X = parse_feature_rows(request)
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+    if not np.isfinite(X).all():
+        return jsonify({'error': 'feature values must be finite numbers'}), 400
+
+    probabilities = diagnostics.predict_probabilities(X)
+    return jsonify({'columns': predictors,
+                    'probabilities': probabilities.tolist(),
+                    'predictions': (probabilities > 0.5).astype(int).tolist()})
+
 #######################Scoring Endpoint
-@app.route("/scoring", methods=['GET','OPTIONS'])
+def submit_scoring():
+    #scoring results are reused while the trained model and test data are unchanged
+    key = (file_version(os.path.join(model_path, 'trainedmodel.pkl')),
+           file_version(os.path.join(test_data_path, 'testdata.csv')))
+    return manager.submit('scoring', key, lambda: {'F1 score': scoring.score_model()})
+
+@app.route("/scoring", methods=['GET','POST','OPTIONS'])
 def get_score():        
     #check the score of the deployed model
-    return {'F1 score': scoring.score_model()}
+    #POST enqueues the job and answers 202, GET waits for the result
+    job = submit_scoring()
+    if request.method == 'POST':
+        return job_response(job)
+    if not job.wait(job_wait_timeout) or job.status == 'error':
+        return job_response(job)
+    return job.result
 
 #######################Summary Statistics Endpoint
 @app.route("/summarystats", methods=['GET','OPTIONS'])
 def get_stats():        
     #check means, medians, and modes for each column
-    return {'key statistics': {c:{'mean':diagnostics.dataframe_summary()[i],
-                                  'median':diagnostics.dataframe_summary()[i+4],
-                                  'std':diagnostics.dataframe_summary()[i+8]} 
-    for c,i in zip(['lastmonth_activity','lastyear_activity','number_of_employees'], range(3))
+    statistics = diagnostics.summary_statistics()['statistics']
+    return {'key statistics': {c:statistics[c]
+    for c in ['lastmonth_activity','lastyear_activity','number_of_employees']
                                 }
             }
 
 #######################Diagnostics Endpoint
-@app.route("/diagnostics", methods=['GET','OPTIONS'])
-def get_diagnostics():        
+def compute_diagnostics():        
     #check timing and percent NA values
-    missing_data = diagnostics.missing_data()
+    missing_data = diagnostics.summary_statistics()['missing data']
     timing = diagnostics.execution_time()
+    metrics = diagnostics.stage_metrics()
     dependency_check = diagnostics.outdated_packages_list()
     return {'execution time': {step:duration 
                 for step, duration in zip(['ingestion step','training step'],
                                             timing)}, 
-            'missing data': {col:pct 
-                for col, pct in zip(['lastmonth_activity',
-                                    'lastyear_activity',
-                                    'number_of_employees',
-                                    'exited'], missing_data)},
-            'dependency check':[{'Module':row[0], 
-                                'Version':row[1][0], 
-                                'Vlatest':row[1][1]} 
-                                for row in dependency_check.iterrows()]
+            'stage metrics': metrics,
+            'missing data': {col:missing_data[col] 
+                for col in ['lastmonth_activity',
+                            'lastyear_activity',
+                            'number_of_employees',
+                            'exited']},
+            'dependency check':[{'Module':package, 
+                                'Version':row['Version'], 
+                                'Vlatest':row['Latest']} 
+                                for package, row in dependency_check.iterrows()]
             }
 
+def submit_diagnostics():
+    #diagnostics results are reused while the dataset, deployed model and stage metrics
+    #are unchanged, and for at most dependency_cache_ttl seconds
+    key = (ingestion.dataset_version(), registry.current_version(), metrics_version(),
+           int(time.time() // dependency_cache_ttl))
+    return manager.submit('diagnostics', key, compute_diagnostics)
+
+@app.route("/diagnostics", methods=['GET','POST','OPTIONS'])
+def get_diagnostics():
+    #POST enqueues the job and answers 202, GET waits for the result
+    job = submit_diagnostics()
+    if request.method == 'POST':
+        return job_response(job)
+    if not job.wait(job_wait_timeout) or job.status == 'error':
+        return job_response(job)
+    return job.result
+
+#######################Background Jobs Endpoint
+@app.route("/jobs/<job_id>", methods=['GET'])
+def get_job(job_id):
+    #status of a background job, ?wait=<seconds> blocks until it ends
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'unknown job {job_id}'}), 404
+    return job_response(job, wait_parameter())
+
 if __name__ == "__main__":    
     app.run(host='0.0.0.0', port=8000, debug=True, threaded=True)
@@ -0,0 +1,144 @@
+import os
+import json
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from storage import CsvStore, store_for_path
+from features import FEATURES, model_input
+from diagnostics import deployed_model
+from instrumentation import instrument, record_rows
+
+##################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+predictors = FEATURES[:-1]
+
+
+##################Streaming batch prediction
+# input files are read chunk by chunk and predictions are written out as soon
+# as a chunk is scored, so peak memory depends on the chunk size only
+
+def iter_input_chunks(source, chunksize=None):
+    """read the predictors of an input dataset chunk by chunk
+    input: path of a csv file or of a dataset in a storage format (.cols, .parquet),
+           or a readable csv file object, and optional number of rows per chunk
+    output: iterator of dataframes
+    """
+    chunksize = chunksize or config.get('chunksize', 100000)
+    store = store_for_path(source) if isinstance(source, str) else CsvStore()
+    return store.iter_chunks(source, predictors, chunksize)
+
+
+def check_input(source, name=None):
+    """check that an input dataset exists and holds the predictors
+    called before a prediction stream starts, so errors are reported up front
+    input: path of the input dataset and optional name of the dataset in errors
+    output: None, raises ValueError when the dataset cannot be predicted
+    """
+    if not source:
+        raise ValueError('no input dataset given')
+    name = name or source
+    store = store_for_path(source)
+    if not store.exists(source):
+        raise ValueError(f'input dataset {name} not found')
+    missing = [col for col in predictors if col not in store.columns(source)]
+    if missing:
+        raise ValueError(f'input dataset {name} misses columns {missing}')
+
+
+def iter_probabilities(chunks, workers=None):
+    """score chunks with the deployed model, in input order
+    with several workers, chunks are scored on a thread pool while the next
+    ones are read; at most two chunks per worker are held in memory
+    rows with a missing predictor are not scored, their probability is NaN
+    input: iterator of dataframes and optional number of scoring threads
+    output: iterator of arrays of churn probabilities, one per chunk
+    """
+    model = deployed_model()
+
+    def score(chunk):
+        X = chunk[predictors].to_numpy(dtype=np.float64)
+        valid = np.isfinite(X).all(axis=1)
+        probabilities = np.full(len(X), np.nan)
+        if valid.any():
+            probabilities[valid] = model.predict_proba(model_input(model, X[valid]))[:, 1]
+        return probabilities
+
+    workers = workers or config.get('prediction_workers', 1)
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield score(chunk)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(score, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_csv_predictions(source, chunksize=None, workers=None):
+    """predictions of an input dataset as csv text, one piece per chunk
+    probabilities are written with 6 decimals; str.format over python lists
+    is about three times faster than DataFrame.to_csv here; rows with a missing
+    predictor get empty fields, so output lines match input rows
+    output: iterator of strings, header first
+    """
+    yield 'probability,prediction\n'
+    for probabilities in iter_probabilities(iter_input_chunks(source, chunksize), workers):
+        predictions = (probabilities > 0.5).astype(int)
+        lines = list(map('{:.6f},{:d}\n'.format, probabilities.tolist(), predictions.tolist()))
+        for i in np.flatnonzero(np.isnan(probabilities)).tolist():
+            lines[i] = ',\n'
+        yield ''.join(lines)
+
+
+def iter_with_error_record(pieces):
+    """pass csv pieces through and end with an 'error,<message>' line on failure
+    once a streamed response started its status can no longer change, so an
+    error raised by a later chunk (unparsable values, model failure) is
+    reported in band instead of silently truncating the output
+    """
+    try:
+        yield from pieces
+    except Exception as e:
+        message = f'{type(e).__name__}: {e}'.replace('"', '""')
+        yield f'error,"{message}"\n'
+
+
+@instrument('prediction')
+def predict_file(inputpath, outputpath, chunksize=None, workers=None):
+    """
+    predict a dataset of any size with bounded memory
+    input: path of the input dataset, path of the csv file of predictions to write,
+           optional number of rows per chunk and number of scoring threads
+    output: number of rows predicted
+    """
+    rows = 0
+    with open(outputpath + '.tmp', 'w') as f:
+        for piece in iter_csv_predictions(inputpath, chunksize, workers):
+            f.write(piece)
+            rows += piece.count('\n')
+    os.replace(outputpath + '.tmp', outputpath)
+
+    # header line excluded
+    record_rows(rows - 1)
+    return rows - 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='predict a dataset chunk by chunk with the deployed model')
+    parser.add_argument('input', help='csv file, or dataset in a storage format (.cols, .parquet)')
+    parser.add_argument('output', help='csv file of probabilities and predictions')
+    parser.add_argument('--chunksize', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    print(predict_file(args.input, args.output, args.chunksize, args.workers))
@@ -0,0 +1,78 @@
+"""
+Compare incremental retraining against a full refit
+a base dataset and a stream of batches are simulated; after each batch the model
+is either refit on all the history or updated from the batch and a reservoir
+sample, then both are evaluated on the same holdout set
+usage (from the repository root): python benchmarks/bench_incremental_training.py
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features import FEATURES
+from training import make_model, fit_incremental, update_reservoir
+import generate_data
+
+predictors = FEATURES[:-1]
+# corporation codes are not used by the model, a few are enough
+corporations = np.array(['abcd'])
+
+
+def simulate(rows, rng):
+    """predictors and target of a synthetic churn dataset, see generate_data.simulate"""
+    dataset = generate_data.simulate(rows, rng, corporations)
+    return dataset[predictors], dataset['exited']
+
+
+def evaluate(model, X, y):
+    return {'f1': metrics.f1_score(y, model.predict(X)),
+            'log_loss': metrics.log_loss(y, model.predict_proba(X)[:, 1])}
+
+
+def main(base_rows, batch_rows, batches, reservoir_size, seed):
+    rng = np.random.default_rng(seed)
+    X_test, y_test = simulate(50000, rng)
+    X_hist, y_hist = simulate(base_rows, rng)
+
+    model = make_model().fit(X_hist, y_hist)
+    reservoir = {'X': np.empty((0, len(predictors))), 'y': np.empty(0, dtype=np.int64), 'seen': 0}
+    reservoir = update_reservoir(reservoir, X_hist.values, y_hist.values, reservoir_size, rng)
+
+    print(f'{"batch":>5} {"history":>9} | {"full s":>7} {"full f1":>8} {"full ll":>8} '
+          f'| {"incr s":>7} {"incr f1":>8} {"incr ll":>8}')
+    incremental = model
+    for batch in range(1, batches + 1):
+        X_new, y_new = simulate(batch_rows, rng)
+        X_hist = pd.concat([X_hist, X_new], ignore_index=True)
+        y_hist = np.concatenate([y_hist, y_new])
+
+        start = time.perf_counter()
+        full = make_model().fit(X_hist, y_hist)
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        X_fit = pd.DataFrame(np.concatenate([reservoir['X'], X_new.values]), columns=predictors)
+        y_fit = np.concatenate([reservoir['y'], y_new])
+        incremental = fit_incremental(incremental, X_fit, y_fit)
+        reservoir = update_reservoir(reservoir, X_new.values, y_new, reservoir_size, rng)
+        incremental_time = time.perf_counter() - start
+
+        f, i = evaluate(full, X_test, y_test), evaluate(incremental, X_test, y_test)
+        print(f'{batch:>5} {len(X_hist):>9} | {full_time:>7.3f} {f["f1"]:>8.4f} {f["log_loss"]:>8.4f} '
+              f'| {incremental_time:>7.3f} {i["f1"]:>8.4f} {i["log_loss"]:>8.4f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-rows', type=int, default=1000000)
+    parser.add_argument('--batch-rows', type=int, default=10000)
+    parser.add_argument('--batches', type=int, default=5)
+    parser.add_argument('--reservoir-size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args.base_rows, args.batch_rows, args.batches, args.reservoir_size, args.seed)
@@ -0,0 +1,57 @@
+"""
+Measure report generation time and peak memory per report format
+each run happens in a fresh process so that import time and peak rss are
+those of a standalone reporting.py run; a last run generates the report
+several times in one process to check that memory does not grow across runs
+usage (from the repository root): python benchmarks/bench_reporting.py
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# executed in a child process from the repository root
+RUN = """
+import json, sys, time, resource
+start = time.perf_counter()
+import reporting
+imported = time.perf_counter()
+rss = []
+for _ in range({repeat}):
+    reporting.score_model('{report_format}')
+    rss.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+print(json.dumps({{'import': imported - start,
+                   'report': (time.perf_counter() - imported) / {repeat},
+                   'matplotlib': 'matplotlib' in sys.modules,
+                   'rss': rss}}))
+"""
+
+
+def run(report_format, repeat=1):
+    output = subprocess.run([sys.executable, '-c', RUN.format(report_format=report_format, repeat=repeat)],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(formats, repeat):
+    print(f'{"format":>6} | {"import s":>8} {"report s":>8} {"peak MB":>8} {"matplotlib":>10}')
+    for report_format in formats:
+        result = run(report_format)
+        print(f'{report_format:>6} | {result["import"]:>8.3f} {result["report"]:>8.3f} '
+              f'{result["rss"][-1]:>8.1f} {str(result["matplotlib"]):>10}')
+
+    if repeat > 1:
+        result = run('pdf', repeat)
+        print(f'\npeak MB after each of {repeat} pdf reports in one process:')
+        print(' '.join(f'{rss:.1f}' for rss in result['rss']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--formats', nargs='+', default=['pdf', 'html', 'json'])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.formats, args.repeat)
@@ -0,0 +1,99 @@
+"""
+Generate synthetic corporation churn datasets with the schema of sourcedata
+rows are split across several csv files; a share of rows can be exact
+duplicates of earlier rows (within and across files) and a share of predictor
+values can be missing, as in real monthly extracts
+usage (from the repository root):
+    python benchmarks/generate_data.py --rows 1000000 --files 10 --output /tmp/sourcedata
+"""
+import os
+import string
+import argparse
+import numpy as np
+import pandas as pd
+
+PREDICTORS = ['lastmonth_activity', 'lastyear_activity', 'number_of_employees']
+
+
+def simulate(rows, rng, corporations=None):
+    """churn dataset where smaller activity and headcount increase churn
+    input: number of rows, numpy random generator and optional array of
+           corporation codes to draw from
+    output: dataframe with the columns of storage.SCHEMA
+    """
+    if corporations is None:
+        corporations = corporation_codes(max(rows // 4, 1), rng)
+    dataset = pd.DataFrame({'corporation': rng.choice(corporations, rows),
+                            'lastmonth_activity': rng.lognormal(6, 1.5, rows).round(),
+                            'lastyear_activity': rng.lognormal(5, 1.5, rows).round(),
+                            'number_of_employees': rng.lognormal(4, 1.2, rows).round()})
+    logit = (1.5 - 3e-4 * dataset['lastmonth_activity'] - 1e-3 * dataset['lastyear_activity']
+             - 4e-3 * dataset['number_of_employees'])
+    dataset['exited'] = (rng.random(rows) < 1 / (1 + np.exp(-logit))).astype(np.int64)
+    return dataset
+
+
+def corporation_codes(count, rng, length=4):
+    """random lower-case corporation codes, as in sourcedata"""
+    letters = np.array(list(string.ascii_lowercase))
+    return np.unique([''.join(code) for code in rng.choice(letters, (count, length))])
+
+
+def add_missing(dataset, na_rate, rng):
+    """blank a share of the predictor values"""
+    for col in PREDICTORS:
+        dataset.loc[rng.random(len(dataset)) < na_rate, col] = np.nan
+    return dataset
+
+
+def generate(rows, files, duplicate_rate=0.0, na_rate=0.0, seed=0):
+    """generate the content of the source files
+    input: total number of rows, number of files, share of rows duplicating an
+           earlier row, share of missing predictor values and random seed
+    output: list of dataframes, one per file
+    """
+    rng = np.random.default_rng(seed)
+    corporations = corporation_codes(max(rows // 4, 1), rng)
+    datasets = []
+    previous = []
+    for rows_in_file in np.diff(np.linspace(0, rows, files + 1).astype(np.int64)):
+        # keep at least one new row per file
+        duplicates = min(rng.binomial(rows_in_file, duplicate_rate), max(rows_in_file - 1, 0))
+        dataset = add_missing(simulate(rows_in_file - duplicates, rng, corporations), na_rate, rng)
+        if duplicates:
+            pool = pd.concat(previous + [dataset], ignore_index=True)
+            dataset = pd.concat([dataset, pool.sample(duplicates, replace=True, random_state=rng)],
+                                ignore_index=True)
+            dataset = dataset.sample(frac=1, random_state=rng).reset_index(drop=True)
+        datasets.append(dataset)
+        previous.append(dataset)
+    return datasets
+
+
+def write(datasets, folder, prefix='dataset'):
+    """write generated datasets as csv files
+    output: list of written paths
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i, dataset in enumerate(datasets, 1):
+        path = os.path.join(folder, f'{prefix}{i}.csv')
+        dataset.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--na-rate', type=float, default=0.0,
+                        help='share of missing predictor values, for ingestion-only benchmarks: '
+                             'training does not accept missing values')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='sourcedata')
+    args = parser.parse_args()
+    for path in write(generate(args.rows, args.files, args.duplicate_rate, args.na_rate, args.seed),
+                      args.output):
+        print(path)
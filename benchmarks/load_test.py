@@ -0,0 +1,129 @@
+"""
+Load test the model API served by a local gunicorn instance
+gunicorn is started with gunicorn.conf.py for each worker count, requests are
+sent by concurrent clients, then throughput, latency percentiles and the memory
+of the workers are reported; PSS (proportional set size) counts pages shared
+between workers once, so it shows what preloading saves compared to RSS
+usage (from the repository root): python benchmarks/load_test.py --workers 1 2 4
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# endpoint name -> (method, path, json body)
+ENDPOINTS = {'predict': ('POST', '/v2/predict',
+                         {'data': [[45, 0, 99], [36, 234, 541], [23, 555, 23], [12, 33, 3]] * 25}),
+             'summarystats': ('GET', '/summarystats', None),
+             'diagnostics': ('GET', '/diagnostics', None),
+             'scoring': ('GET', '/scoring', None)}
+
+
+def start_server(workers, threads, port, cwd):
+    env = dict(os.environ, GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads),
+               GUNICORN_BIND=f'127.0.0.1:{port}')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'wsgi:app'], cwd=cwd, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + '/', timeout=1).ok and len(worker_pids(server.pid)) == workers:
+                return server, url
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError('gunicorn did not start, run it by hand to see its errors')
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=30)
+
+
+def worker_pids(master_pid):
+    """pids of the worker processes forked by the gunicorn master"""
+    with open(f'/proc/{master_pid}/task/{master_pid}/children', 'r') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory_mb(pid):
+    """rss and pss of a process in MB, from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                values[key] = int(rest.split()[0]) / 1024
+    return values.get('Rss', 0.0), values.get('Pss', 0.0)
+
+
+def load(url, endpoint, requests_count, concurrency):
+    """send requests from concurrent clients, each with its own connection pool
+    output: array of latencies in seconds and number of failed requests
+    """
+    method, path, body = ENDPOINTS[endpoint]
+    per_client = max(requests_count // concurrency, 1)
+
+    def client(_):
+        latencies, errors = [], 0
+        with requests.Session() as session:
+            for _ in range(per_client):
+                start = time.perf_counter()
+                response = session.request(method, url + path, json=body, timeout=60)
+                latencies.append(time.perf_counter() - start)
+                errors += not response.ok
+        return latencies, errors
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, range(concurrency)))
+    return (np.array([latency for latencies, _ in results for latency in latencies]),
+            sum(errors for _, errors in results))
+
+
+def main(workers_list, threads, concurrency, requests_count, endpoints, port, cwd):
+    print(f'{"workers":>7} {"endpoint":<13} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>6}')
+    memory = []
+    for workers in workers_list:
+        server, url = start_server(workers, threads, port, cwd)
+        try:
+            for endpoint in endpoints:
+                # warm up every worker before measuring
+                load(url, endpoint, workers * threads, workers * threads)
+                start = time.perf_counter()
+                latencies, errors = load(url, endpoint, requests_count, concurrency)
+                elapsed = time.perf_counter() - start
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+                print(f'{workers:>7} {endpoint:<13} {len(latencies) / elapsed:>8.0f} '
+                      f'{p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {errors:>6}')
+            pids = worker_pids(server.pid)
+            rss, pss = np.array([memory_mb(pid) for pid in pids]).sum(axis=0)
+            memory.append((workers, memory_mb(server.pid), rss, pss))
+        finally:
+            stop_server(server)
+
+    print(f'\n{"workers":>7} {"master RSS":>10} {"workers RSS":>11} {"workers PSS":>11} {"PSS/worker":>10}  (MB)')
+    for workers, (master_rss, _), rss, pss in memory:
+        print(f'{workers:>7} {master_rss:>10.1f} {rss:>11.1f} {pss:>11.1f} {pss / workers:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cwd', default=ROOT, help='folder holding config.json and the deployed model')
+    args = parser.parse_args()
+    main(args.workers, args.threads, args.concurrency, args.requests, args.endpoints, args.port, args.cwd)
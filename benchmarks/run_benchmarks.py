@@ -0,0 +1,316 @@
+"""
+End-to-end benchmark of the pipeline on synthetic data
+a workspace holding a copy of the code and generated source and test data is
+built, then every stage runs in its own process in pipeline order (ingestion,
+training, scoring, deployment, diagnostics, reporting, API endpoints); each
+case reports latency percentiles, throughput and peak memory
+results are appended to benchmarks/results.jsonl and compared with the
+previous runs at the same scale to catch regressions
+usage (from the repository root): python benchmarks/run_benchmarks.py --rows 1000000
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+RESULTS = os.path.join(BENCHMARKS, 'results.jsonl')
+
+sys.path.insert(0, BENCHMARKS)
+from generate_data import generate, write
+
+
+##################Benchmark cases
+# each case runs in the workspace, in a fresh process, and returns a function
+# to time, which returns the number of rows processed if meaningful, and its
+# default number of calls; cases run in this order and later ones use the
+# artifacts of earlier ones (master dataset, trained and deployed model)
+
+def case_ingestion_full():
+    import ingestion
+    return lambda: len(ingestion.merge_multiple_dataframe(full_refresh=True)), 1
+
+
+def case_ingestion_noop():
+    import ingestion
+    return lambda: len(ingestion.merge_multiple_dataframe()), 5
+
+
+def case_training():
+    import training, ingestion
+    rows = sum(len(chunk) for chunk in ingestion.iter_master(['exited']))
+
+    def run():
+        training.train_model('full')
+        return rows
+    return run, 1
+
+
+def case_scoring():
+    import scoring, evaluation
+
+    def run():
+        # cold evaluation: predictions are not reused across repetitions
+        evaluation.memo.clear()
+        if os.path.exists(evaluation.evaluations_path):
+            os.remove(evaluation.evaluations_path)
+        scoring.score_model()
+        return evaluation.evaluate()['rows']
+    return run, 5
+
+
+def case_deployment():
+    import deployment
+
+    def run():
+        deployment.store_model_into_pickle()
+    return run, 3
+
+
+def case_statistics():
+    import diagnostics, ingestion
+    rows = sum(len(chunk) for chunk in ingestion.iter_master(['exited']))
+
+    def run():
+        # streaming pass over the master dataset, bypassing the statistics cache
+        diagnostics.compute_statistics()
+        return rows
+    return run, 3
+
+
+def case_predictions():
+    import pandas as pd
+    import diagnostics
+    dataset = pd.read_csv(os.path.join('testdata', 'testdata.csv'))
+    return lambda: len(diagnostics.model_predictions(dataset)), 10
+
+
+def case_batch_prediction():
+    import batchprediction
+    source = os.path.join('testdata', 'testdata.csv')
+    return lambda: batchprediction.predict_file(source, 'predictions.csv'), 3
+
+
+def case_reporting_json():
+    import reporting
+
+    def run():
+        reporting.score_model('json')
+    return run, 3
+
+
+def case_reporting_pdf():
+    import reporting
+
+    def run():
+        reporting.score_model('pdf')
+    return run, 3
+
+
+def endpoint_case(method, url, rows=0, **kwargs):
+    def case():
+        import app
+        client = app.app.test_client()
+
+        def run():
+            response = client.open(url, method=method, **kwargs)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{method} {url} answered {response.status_code}')
+            response.get_data()
+            return rows
+        return run, 200
+    return case
+
+
+def case_api_v2_predict():
+    import pandas as pd
+    from features import FEATURES
+    batch = pd.read_csv(os.path.join('testdata', 'testdata.csv'), nrows=1000)[FEATURES[:-1]]
+    return endpoint_case('POST', '/v2/predict', len(batch),
+                         json={'data': batch.fillna(0).values.tolist()})()
+
+
+CASES = {'ingestion full': case_ingestion_full,
+         'ingestion no new data': case_ingestion_noop,
+         'training': case_training,
+         'scoring': case_scoring,
+         'deployment': case_deployment,
+         'statistics': case_statistics,
+         'predictions': case_predictions,
+         'batch prediction': case_batch_prediction,
+         'reporting json': case_reporting_json,
+         'reporting pdf': case_reporting_pdf,
+         'api /v2/predict': case_api_v2_predict,
+         'api /summarystats': endpoint_case('GET', '/summarystats'),
+         'api /diagnostics': endpoint_case('GET', '/diagnostics'),
+         'api /scoring': endpoint_case('GET', '/scoring'),
+         'api /prediction stream': endpoint_case('GET', '/prediction?stream=true&filename=testdata/testdata.csv')}
+
+
+def run_case(name, repeat=None):
+    """run a case in the current process, called in the workspace by the child process
+    output: dict of measurements
+    """
+    import resource
+
+    func, default_repeat = CASES[name]()
+    repeat = repeat or default_repeat
+    latencies, rows = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows += func() or 0
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies)
+    return {'case': name,
+            'repeat': repeat,
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'rows_per_sec': rows / latencies.sum() if rows else None,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+##################Workspace
+def build_workspace(workspace, rows, files, duplicate_rate, na_rate, test_rows, seed):
+    """copy the code and generate source and test data in a workspace folder"""
+    for path in glob.glob(os.path.join(ROOT, '*.py')) + [os.path.join(ROOT, 'requirements.txt')]:
+        shutil.copy(path, workspace)
+
+    with open(os.path.join(ROOT, 'config.json'), 'r') as f:
+        config = json.load(f)
+    config.update({'input_folder_path': 'sourcedata',
+                   'output_folder_path': 'ingesteddata',
+                   'test_data_path': 'testdata',
+                   'output_model_path': 'models',
+                   'prod_deployment_path': 'production_deployment'})
+    with open(os.path.join(workspace, 'config.json'), 'w') as f:
+        json.dump(config, f)
+    for folder in ['ingesteddata', 'models', 'production_deployment']:
+        os.makedirs(os.path.join(workspace, folder), exist_ok=True)
+
+    write(generate(rows, files, duplicate_rate, na_rate, seed), os.path.join(workspace, 'sourcedata'))
+    write(generate(test_rows, 1, 0.0, 0.0, seed + 1), os.path.join(workspace, 'testdata'), 'testdata')
+    os.rename(os.path.join(workspace, 'testdata', 'testdata1.csv'),
+              os.path.join(workspace, 'testdata', 'testdata.csv'))
+
+
+def run_in_workspace(workspace, name, repeat=None):
+    """run a case in a fresh process so that peak memory is the one of the case"""
+    command = [sys.executable, os.path.abspath(__file__), '--case', name]
+    if repeat:
+        command += ['--repeat', str(repeat)]
+    process = subprocess.run(command, cwd=workspace, capture_output=True, text=True)
+    if process.returncode:
+        raise RuntimeError(f'benchmark case {name} failed:\n{process.stderr}')
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+##################Results history
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_results():
+    if not os.path.exists(RESULTS):
+        return []
+    with open(RESULTS, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_results(records):
+    with open(RESULTS, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def regressions(records, history, tolerance, window=5):
+    """compare results with the median of the last runs at the same scale
+    a case regresses when its median latency or its peak memory exceeds the
+    historical median by more than tolerance
+    output: list of messages
+    """
+    messages = []
+    for record in records:
+        previous = [r for r in history if r['case'] == record['case'] and r['scale'] == record['scale']][-window:]
+        if not previous:
+            continue
+        for metric in ['p50', 'peak_rss_mb']:
+            baseline = float(np.median([r[metric] for r in previous]))
+            if baseline and record[metric] > baseline * (1 + tolerance):
+                messages.append(f"{record['case']}: {metric} {record[metric]:.3f} "
+                                f"vs {baseline:.3f} over the last {len(previous)} runs")
+    return messages
+
+
+def main(args):
+    scale = {'rows': args.rows, 'files': args.files, 'duplicate_rate': args.duplicate_rate,
+             'na_rate': args.na_rate, 'test_rows': args.test_rows}
+    names = args.cases or list(CASES)
+    workspace = args.workspace or tempfile.mkdtemp(prefix='benchmark-')
+    print(f'workspace: {workspace}')
+    build_workspace(workspace, args.rows, args.files, args.duplicate_rate, args.na_rate,
+                    args.test_rows, args.seed)
+
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    commit = git_commit()
+    records = []
+    print(f'{"case":<24} {"repeat":>6} {"p50 s":>8} {"p95 s":>8} {"p99 s":>8} {"rows/s":>11} {"peak MB":>8}')
+    for name in names:
+        record = run_in_workspace(workspace, name, args.repeat)
+        record.update({'timestamp': timestamp, 'commit': commit, 'scale': scale})
+        records.append(record)
+        rows_per_sec = f"{record['rows_per_sec']:>11.0f}" if record['rows_per_sec'] else f'{"":>11}'
+        print(f"{name:<24} {record['repeat']:>6} {record['p50']:>8.4f} {record['p95']:>8.4f} "
+              f"{record['p99']:>8.4f} {rows_per_sec} {record['peak_rss_mb']:>8.1f}")
+
+    messages = regressions(records, read_results(), args.tolerance)
+    if not args.no_save:
+        append_results(records)
+    if not args.workspace:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    for message in messages:
+        print(f'REGRESSION {message}')
+    return 1 if messages and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--na-rate', type=float, default=0.0,
+                        help='share of missing predictor values; training does not accept missing values')
+    parser.add_argument('--test-rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=None,
+                        help='cases to run, all by default; cases use the artifacts of the previous ones')
+    parser.add_argument('--repeat', type=int, default=None, help='calls per case, case default otherwise')
+    parser.add_argument('--workspace', default=None, help='keep the workspace in this folder')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before reporting a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--no-save', action='store_true', help='do not append results to the history')
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # child process: run one case in the workspace
+        sys.path.insert(0, os.getcwd())
+        print(json.dumps(run_case(args.case, args.repeat)))
+    else:
+        sys.exit(main(args))
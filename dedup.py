@@ -0,0 +1,165 @@
+import os
+import numpy as np
+import pandas as pd
+
+import storage
+
+
+##################Row deduplication with a persisted 64-bit hash index
+# rows are reduced to 64-bit hashes of their columns (exact policy) or of their
+# key columns (keep-first and keep-latest policies); the hashes of the master
+# dataset are kept sorted on disk, so duplicates are found with a vectorized
+# binary search at 8 bytes per row instead of comparing object columns
+#
+# policies:
+# - exact: a row is dropped when an identical row was already ingested
+# - keep-first: a row is dropped when a row with the same key was already ingested
+# - keep-latest: a row replaces the ingested row with the same key; rows of later
+#   source files (in file name order) and later lines win
+#
+# with the key policies every key is held by one master row; the position of
+# that row is persisted next to the key index (keyrows.npy, aligned with the
+# sorted key hashes), so keep-latest finds the rows it replaces without reading
+# or hashing the master dataset; removing them still rewrites the master
+# dataset, so a batch replacing keys costs a pass over the history
+
+POLICIES = ['exact', 'keep-first', 'keep-latest']
+
+
+def row_hashes(dataset, columns=None):
+    """ hash each row of a dataset into a 64-bit key
+    numeric columns are hashed as float64 so 3 and 3.0 collide like in drop_duplicates
+    input: dataset to hash and optional columns to hash, all columns by default
+    output: numpy array of uint64 row hashes
+    """
+    normalized = (dataset[columns] if columns is not None else dataset).copy()
+    for col in normalized.columns:
+        if pd.api.types.is_numeric_dtype(normalized[col]):
+            normalized[col] = normalized[col].astype('float64')
+    return pd.util.hash_pandas_object(normalized, index=False).values
+
+
+def read_index(filepath):
+    """ read a persisted hash index
+    input: path to the index file
+    output: sorted numpy array of uint64 hashes
+    """
+    if not os.path.exists(filepath):
+        return np.empty(0, dtype=np.uint64)
+    return np.load(filepath)
+
+
+def write_index(filepath, index):
+    """ save a hash index atomically
+    input: path to the index file and sorted array of hashes
+    output: None
+    """
+    tmppath = filepath + '.tmp.npy'
+    np.save(tmppath, index)
+    os.replace(tmppath, filepath)
+
+
+def in_index(index, hashes):
+    """ check membership of hashes in a sorted index
+    input: sorted index and hashes to look up
+    output: boolean mask, True when the hash is already indexed
+    """
+    if len(index) == 0:
+        return np.zeros(len(hashes), dtype=bool)
+    position = np.searchsorted(index, hashes)
+    position[position == len(index)] = len(index) - 1
+    return index[position] == hashes
+
+
+def index_filename(policy):
+    """ name of the index file of a policy, exact and key policies index different hashes """
+    return 'rowhashes.npy' if policy == 'exact' else 'keyhashes.npy'
+
+
+def read_positions(filepath, index):
+    """ read the master row positions of the indexed keys
+    input: path to the positions file and sorted key index
+    output: array of row positions aligned with the index, None when missing
+            or out of step with the index
+    """
+    if not os.path.exists(filepath):
+        return None
+    positions = np.load(filepath)
+    return positions if len(positions) == len(index) else None
+
+
+def key_positions(master, key_columns):
+    """ key index and row positions computed from the master dataset
+    input: master dataset holding at least the key columns, one row per key
+    output: sorted key hashes and the row position of each key
+    """
+    hashes = row_hashes(master, key_columns)
+    order = np.argsort(hashes, kind='stable')
+    return hashes[order], order.astype(np.int64)
+
+
+def update_positions(index, positions, newhashes, removed):
+    """ key index and row positions after removing rows and appending new ones
+    input: sorted key index and row positions, key hashes of the appended rows
+           and sorted positions of the removed rows
+    output: updated sorted key index and row positions
+    """
+    kept = ~in_index(removed, positions)
+    index, positions = index[kept], positions[kept]
+    # remaining rows move up by the number of removed rows before them
+    positions = positions - np.searchsorted(removed, positions)
+    index = np.concatenate([index, newhashes])
+    positions = np.concatenate([positions, len(positions) + np.arange(len(newhashes), dtype=np.int64)])
+    order = np.argsort(index, kind='stable')
+    return index[order], positions[order]
+
+
+def dataset_hashes(dataset, policy, key_columns):
+    """ hashes deduplicated by a policy: full rows for exact, key columns otherwise """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown dedup policy '{policy}', expected one of {POLICIES}")
+    return row_hashes(dataset, None if policy == 'exact' else key_columns)
+
+
+def deduplicate(hashes, index, policy):
+    """ decide which new rows to keep
+    input: hashes of the new rows in source order, sorted index of the ingested rows
+           and dedup policy
+    output: boolean mask of the new rows to keep and boolean mask, among them,
+            of the rows replacing an ingested row (keep-latest only)
+    """
+    duplicated = pd.Series(hashes).duplicated(keep='last' if policy == 'keep-latest' else 'first').values
+    seen = in_index(index, hashes)
+    if policy == 'keep-latest':
+        keep = ~duplicated
+        return keep, seen[keep]
+    keep = ~duplicated & ~seen
+    return keep, np.zeros(int(keep.sum()), dtype=bool)
+
+
+def replace_rows(master, newdata, newhashes, replacing, index, positions):
+    """ apply keep-latest replacements to the master dataset
+    new rows identical to the ingested row with the same key are not replacements
+    and are dropped
+    input: master dataset, new rows, their key hashes, mask of the new rows whose
+           key is already ingested, sorted key index and row positions of the keys
+    output: updated master dataset (None when nothing is replaced),
+            new rows and their key hashes without the unchanged rows,
+            sorted key hashes and sorted positions of the replaced rows
+    """
+    # master row of each replacing row, only these rows are hashed
+    located = positions[np.searchsorted(index, newhashes[replacing])]
+    same = row_hashes(master.iloc[located].reset_index(drop=True)) == row_hashes(newdata[replacing])
+    unchanged = np.zeros(len(newdata), dtype=bool)
+    unchanged[np.flatnonzero(replacing)[same]] = True
+
+    newdata, newhashes, replacing = newdata[~unchanged], newhashes[~unchanged], replacing[~unchanged]
+    replaced = np.unique(newhashes[replacing])
+    removed = np.unique(located[~same])
+    if not len(replaced):
+        return None, newdata, newhashes, replaced, removed
+
+    kept = np.ones(len(master), dtype=bool)
+    kept[removed] = False
+    master = storage.apply_schema(pd.concat([master[kept], newdata], axis=0, ignore_index=True))
+    return master, newdata, newhashes, replaced, removed
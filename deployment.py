@@ -1,6 +1,14 @@
 import os
 import json
 import shutil
+import pickle
+from datetime import datetime
+
+import manifest
+import registry
+from linear_scorer import LinearScorer
+
+from instrumentation import instrument
 
 ##################Load config.json and correct path variable
 with open('config.json','r') as f:
@@ -11,17 +19,73 @@ prod_deployment_path = os.path.join(config['prod_deployment_path'])
 model_path = os.path.join(config['output_model_path']) 
 
 
+def export_compact_model(modelpath, artifactpath):
+    """export a linear model as a compact json artifact served without sklearn
+    nothing is written when the model is not linear
+    input: path of the pickled model and of the artifact to write
+    output: True if the artifact was written
+    """
+    with open(modelpath, 'rb') as f:
+        model = pickle.load(f)
+    import sklearn
+    metadata = {'sklearn_version': sklearn.__version__,
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'source_sha256': manifest.file_digest(modelpath)}
+    scorer = LinearScorer.from_model(model, metadata)
+
+    if scorer is not None:
+        scorer.save(artifactpath)
+    return scorer is not None
+
+
+def export_mapped_model(modelpath, artifactpath):
+    """export a model with joblib, uncompressed, so that its numpy arrays can be
+    memory-mapped on load and shared through the page cache by all serving processes
+    input: path of the pickled model and of the artifact to write
+    """
+    import joblib
+    with open(modelpath, 'rb') as f:
+        model = pickle.load(f)
+    joblib.dump(model, artifactpath)
+
+
 ####################function for deployment
+@instrument('deployment')
 def store_model_into_pickle():
-    
-    #copy the latest pickle file and its latestscore.txt file into the deployment directory
+    """
+    deploy the latest model as a new version of the model registry
+    artifacts are gathered in a staging directory, published as an immutable
+    version and promoted with a single atomic pointer switch, see registry.py
+    output: id of the deployed version
+    """
+    staging = registry.stage()
+
+    #copy the latest pickle file and its latestscore.txt file into the new version
     for file in ['latestscore.txt', 'trainedmodel.pkl']:
-        shutil.copy(os.path.join(model_path,file),
-                    os.path.join(prod_deployment_path,file))
+        shutil.copy(os.path.join(model_path,file), os.path.join(staging,file))
         
-    #copy the ingestfiles.txt file into the deployment directory
+    #export the compact artifact of linear models for numpy-only serving,
+    #other models are exported for memory-mapped serving
+    if not export_compact_model(os.path.join(staging,'trainedmodel.pkl'),
+                                os.path.join(staging,'trainedmodel.json')):
+        export_mapped_model(os.path.join(staging,'trainedmodel.pkl'),
+                            os.path.join(staging,'trainedmodel.joblib'))
+
+    #copy the training histograms used for drift detection, if any
+    histogrampath = os.path.join(model_path,'referencehistograms.json')
+    if os.path.exists(histogrampath):
+        shutil.copy(histogrampath, os.path.join(staging,'referencehistograms.json'))
+
+    #copy the ingestfiles.txt file into the new version
     shutil.copy(os.path.join(dataset_csv_path,'ingestedfiles.txt'),
-                    os.path.join(prod_deployment_path,'ingestedfiles.txt'))
+                os.path.join(staging,'ingestedfiles.txt'))
+
+    #publish and promote the version, then drop old versions
+    version = registry.publish(staging)
+    registry.promote(version)
+    registry.evict()
+
+    return version
 
 if __name__ == '__main__':
     store_model_into_pickle()
\ No newline at end of file
@@ -1,14 +1,18 @@
 import pandas as pd
-import numpy as np
-import timeit
 import os
 import json
-import pickle
-from io import StringIO
-import subprocess
-
-from ingestion import read_csv
-from training import segregate_dataset
+import re
+import time
+import threading
+import importlib.metadata
+
+from ingestion import iter_master, dataset_version
+from features import to_matrix, model_input, test_features
+from storage import SCHEMA, NUMERIC_COLUMNS
+from model_cache import get_model
+import registry
+from streamstats import profile_chunks
+from instrumentation import latest_by_stage
 
 ##################Load config.json and get environment variables
 with open('config.json','r') as f:
@@ -19,140 +23,262 @@ test_data_path = os.path.join(config['test_data_path'])
 prod_deployment_path = os.path.join(config['prod_deployment_path'])
 
 
+##################Function to get the deployed model
+def deployed_model():
+    """
+    get the deployed model from the process-wide cache
+    the compact linear artifact is scored with numpy only and is used when
+    deployed, then the memory-mapped joblib artifact, the sklearn pickle otherwise
+    output: model with predict and predict_proba methods
+    """
+    snapshot = registry.current_path()
+    for artifact in ['trainedmodel.json', 'trainedmodel.joblib']:
+        artifactpath = os.path.join(snapshot, artifact)
+        if os.path.exists(artifactpath):
+            return get_model(artifactpath)
+    return get_model(os.path.join(snapshot, 'trainedmodel.pkl'))
+
+
 ##################Function to get model predictions
 def model_predictions(dataset=None):
     """
     read the deployed model and a test dataset, calculate predictions
+    not instrumented: it serves every /prediction request, batch predictions
+    are recorded by batchprediction.predict_file
     input (optional): dataset to use for prediction evaluation
     output: list of predictions from deployed model
     """
-    # if not dataset provided then use test dataset
+    # if not dataset provided then use the cached feature matrix of the test dataset
     if dataset is None:
-        datasetpath = os.path.join(test_data_path, 'testdata.csv')
-        dataset = read_csv(datasetpath)
+        X, y = test_features(os.path.join(test_data_path, 'testdata.csv'))
+    else:
+        X, y = to_matrix(dataset)
 
-    # collect deployed model
-    modelpath = os.path.join(prod_deployment_path, 'trainedmodel.pkl')
-    with open(modelpath, 'rb') as f:
-        model = pickle.load(f)
-
-    # segregate test dataset
-    X, y = segregate_dataset(dataset)
+    # collect deployed model, deserialized once per process
+    model = deployed_model()
 
     # evaluate model on test set
-    yhat = model.predict(X)
+    yhat = model.predict(model_input(model, X))
 
     return yhat
 
 
-##################Function to get summary statistics
-def dataframe_summary():
-    """calculate summary statistics on the dataset columns"""
+##################Function to get churn probabilities
+def predict_probabilities(X):
+    """
+    score a feature matrix with the deployed model in one vectorized call
+    input: array of shape (n_rows, 3), columns ordered as the training predictors
+    output: array of churn probabilities, one per row
+    """
+    model = deployed_model()
 
-    # collect dataset
-    datasetpath = os.path.join(dataset_csv_path, 'finaldata.csv')
-    dataset = read_csv(datasetpath)
+    return model.predict_proba(model_input(model, X))[:, 1]
 
-    # Select numeric columns
-    numeric_col_index = np.where(dataset.dtypes != object)[0]
-    numeric_col = dataset.columns[numeric_col_index].tolist()
 
-    # compute statistics per numeric column
-    means = dataset[numeric_col].mean(axis=0).tolist()
-    medians = dataset[numeric_col].median(axis=0).tolist()
-    stddevs = dataset[numeric_col].std(axis=0).tolist()
+##################Function to compute dataset statistics
+def compute_statistics():
+    """calculate summary statistics and missing data on the master dataset
+    the dataset is streamed in chunks and profiled in a single pass,
+    medians are exact for up to 4096 distinct values, within
+    quantile_relative_accuracy otherwise
+    output: dict with per column mean, median and std of numeric columns
+            and % of missing data for every column
+    """
+    profile = profile_chunks(iter_master(), list(SCHEMA), NUMERIC_COLUMNS,
+                             config.get('quantile_relative_accuracy', 0.01))
+
+    return profile.result()
+
+
+# in-process copy of the statistics cache: (dataset version, statistics)
+statistics_cache = (None, None)
+
 
-    statistics = means
-    statistics.extend(medians)
-    statistics.extend(stddevs)
+def summary_statistics():
+    """get the statistics of the current master dataset version
+    statistics are computed once per dataset version and stored next to the data
+    output: dict as returned by compute_statistics
+    """
+    global statistics_cache
+
+    version = dataset_version()
+    if version is not None and statistics_cache[0] == version:
+        return statistics_cache[1]
+
+    # read the statistics stored next to the data
+    cachepath = os.path.join(dataset_csv_path, 'summarystats.json')
+    if version is not None and os.path.exists(cachepath):
+        with open(cachepath, 'r') as f:
+            cached = json.load(f)
+        if cached.get('version') == version:
+            statistics_cache = (version, cached['statistics'])
+            return cached['statistics']
+
+    # compute and store statistics for this version
+    statistics = compute_statistics()
+    if version is not None:
+        with open(cachepath + '.tmp', 'w') as f:
+            json.dump({'version': version, 'statistics': statistics}, f)
+        os.replace(cachepath + '.tmp', cachepath)
+        statistics_cache = (version, statistics)
 
     return statistics
 
 
+##################Function to get summary statistics
+def dataframe_summary():
+    """get summary statistics on the dataset numeric columns
+    output: list of means, then medians, then std per numeric column
+    """
+    statistics = summary_statistics()['statistics']
+
+    return [statistics[col][stat] for stat in ['mean', 'median', 'std']
+                for col in NUMERIC_COLUMNS]
+
+
 ##################Function to get missing data
 def missing_data():
-    """calculate missing data on the dataset
+    """get missing data on the dataset
     return % of missing data per column
     """
+    missing = summary_statistics()['missing data']
 
-    # collect dataset
-    datasetpath = os.path.join(dataset_csv_path, 'finaldata.csv')
-    dataset = read_csv(datasetpath)
-
-    # compute missing data % per column
-    missing_data = dataset.isna().sum(axis=0)
-    missing_data /= len(dataset) *100
-
-    return missing_data.tolist()
+    return list(missing.values())
 
 
 ##################Function to get timings
 def execution_time():
-    """calculate timing of training.py and ingestion.py"""
+    """get timing of the last ingestion and training runs
+    timings are read from the stage metrics history, nothing is re-executed
+    output: list of durations in seconds, None for a stage that never ran
+    """
+    records = latest_by_stage()
     timing_measures = []
+    for name in ['ingestion', 'training']:
+        record = records.get(name)
+        timing_measures.append(record['wall_time'] if record else None)
 
-    # timing ingestion step
-    start_time = timeit.default_timer()
-    os.system('python ingestion.py')
-    end_time = timeit.default_timer()
-    duration_step = end_time - start_time
-    timing_measures.append(duration_step)
+    return timing_measures
 
-    # timing ingestion step
-    start_time = timeit.default_timer()
-    os.system('python training.py')
-    end_time = timeit.default_timer()
-    duration_step = end_time - start_time
-    timing_measures.append(duration_step)
 
-    return timing_measures
+def stage_metrics():
+    """get the last recorded metrics of every pipeline stage
+    output: dict of metric records keyed by stage name
+    """
+    records = latest_by_stage()
+    stages = ['ingestion', 'training', 'scoring', 'prediction', 'deployment']
+    return {name: records.get(name) for name in stages}
+
+
+def version_key(version):
+    """sortable key of a version string"""
+    try:
+        from packaging.version import Version
+        return (1, Version(version))
+    except Exception:
+        return (0, tuple(int(p) for p in re.findall(r'\d+', version)))
 
 
-def execute_cmd(cmd):
-    """execute a pip list type cmd
-    input: pip list type of cmd
-    return: output of cmd in dataframe format
+def read_requirements(filepath='requirements.txt'):
+    """read pinned dependencies
+    input: path to a requirements file with package==version lines
+    output: dict of pinned versions keyed by package name
     """
-    a = subprocess.Popen(cmd, stdout=subprocess.PIPE)  # text=True then no need to decode bytes to str
-    b = StringIO(a.communicate()[0].decode('utf-8'))
-    df = pd.read_csv(b, sep="\s+")
-    df.drop(index=[0], axis=0, inplace=True)
-    df = df.set_index('Package')
-    return df
+    requirements = {}
+    with open(filepath, 'r') as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if '==' in line:
+                package, version = line.split('==', 1)
+                requirements[package.strip()] = version.strip()
+    return requirements
+
+
+def read_package_index():
+    """read the latest available versions from the configured package index
+    the index is a local json file mirroring PyPI: {package: version or [versions]}
+    output: dict of latest versions keyed by lower-case package name
+    """
+    indexpath = config.get('package_index_path')
+    if not indexpath or not os.path.exists(indexpath):
+        return {}
+    with open(indexpath, 'r') as f:
+        index = json.load(f)
+
+    latest_versions = {}
+    for package, versions in index.items():
+        if isinstance(versions, str):
+            versions = [versions]
+        if versions:
+            latest_versions[package.lower()] = max(versions, key=version_key)
+    return latest_versions
+
+
+def compute_dependencies():
+    """assemble pinned, installed and latest versions of requirements.txt dependencies
+    installed versions are read in-process with importlib.metadata
+    output: dataframe indexed by package with Version (pinned) and Latest columns
+            Latest is the newest of the installed and the index versions
+    """
+    index = read_package_index()
+    rows = []
+    for package, pinned in read_requirements().items():
+        try:
+            installed = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            # keep only dependencies available in the current environment
+            continue
+        available = index.get(package.lower())
+        if available is None or version_key(installed) >= version_key(available):
+            available = installed
+        rows.append({'Package': package, 'Version': pinned, 'Latest': available})
+
+    return pd.DataFrame(rows, columns=['Package', 'Version', 'Latest']).set_index('Package')
+
+
+# cached dependency audit: (timestamp, dataframe)
+dependency_cache = (None, None)
+dependency_lock = threading.Lock()
+dependency_refreshing = threading.Event()
+
+
+def refresh_dependencies():
+    """recompute the dependency audit and update the cache"""
+    global dependency_cache
+    try:
+        dependencies = compute_dependencies()
+        dependency_cache = (time.monotonic(), dependencies)
+    finally:
+        dependency_refreshing.clear()
+
 
 ##################Function to check dependencies
 def outdated_packages_list():
     """get a list of dependencies and versions
+    the audit is cached for dependency_cache_ttl seconds, a stale result is
+    returned while it is refreshed in a background thread
     input: None
-    output: dataframe with list of outdated dependencies, 
+    output: dataframe with list of dependencies, 
             version as per requirements.txt file,
             and latest version available
     """
-
-    # collect outdated dependencies (for current virtual env)
-    cmd = ['pip', 'list', '--outdated']
-    df = execute_cmd(cmd)
-    df.drop(['Version','Type'], axis=1, inplace=True)
-
-    # collect all dependencies (for current virtual env)
-    cmd = ['pip', 'list']
-    df1 = execute_cmd(cmd)
-    df1 = df1.rename(columns = {'Version':'Latest'})
-
-    # collect dependencies as per requirements.txt file
-    requirements = pd.read_csv('requirements.txt', sep='==', header=None, names=['Package','Version'], engine='python')
-    requirements = requirements.set_index('Package')
-
-    # assemble target and latest versions for requirements.txt dependencies
-    dependencies = requirements.join(df1)
-    for p in df.index:
-        if p in dependencies.index:
-            dependencies.at[p, 'Latest'] = df.at[p,'Latest']
-    
-    # keep only outdated dependencies (ie latest version exists)
-    dependencies.dropna(inplace=True)
-
-    return dependencies
+    timestamp, dependencies = dependency_cache
+    if dependencies is None:
+        # first call: compute synchronously
+        with dependency_lock:
+            if dependency_cache[1] is None:
+                dependency_refreshing.set()
+                refresh_dependencies()
+        return dependency_cache[1].copy()
+
+    ttl = config.get('dependency_cache_ttl', 3600)
+    if time.monotonic() - timestamp > ttl:
+        with dependency_lock:
+            if not dependency_refreshing.is_set():
+                dependency_refreshing.set()
+                threading.Thread(target=refresh_dependencies, daemon=True).start()
+
+    return dependencies.copy()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,158 @@
+import os
+import ast
+import json
+import numpy as np
+
+import manifest
+import registry
+from ingestion import dataset_base
+from training import bin_counts
+from features import FEATURES, master_features, model_input
+from diagnostics import model_predictions, deployed_model
+
+##################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+model_path = os.path.join(config['output_model_path'])
+prod_deployment_path = os.path.join(config['prod_deployment_path'])
+
+predictors = FEATURES[:-1]
+
+
+##################Distribution tests against training histograms
+def psi(reference, current, epsilon=1e-4):
+    """population stability index between two binned distributions"""
+    ref = np.maximum(reference / reference.sum(), epsilon)
+    cur = np.maximum(current / current.sum(), epsilon)
+    return float(((cur - ref) * np.log(cur / ref)).sum())
+
+
+def ks_statistic(reference, current):
+    """two-sample Kolmogorov-Smirnov statistic on binned distributions"""
+    return float(np.abs(np.cumsum(reference) / reference.sum()
+                        - np.cumsum(current) / current.sum()).max())
+
+
+def ks_critical_value(n, m, alpha=0.05):
+    """critical value of the two-sample KS test"""
+    return np.sqrt(-np.log(alpha / 2) / 2) * np.sqrt((n + m) / (n * m))
+
+
+def distribution_tests(dataset, histograms):
+    """compare new rows against the training distribution of each predictor
+    input: dataframe of new rows and reference histograms
+    output: dict per predictor with psi, ks statistic and ks critical value
+    """
+    tests = {}
+    for col in predictors:
+        if col not in histograms:
+            continue
+        reference = np.asarray(histograms[col]['counts'], dtype=np.float64)
+        values = dataset[col].dropna().values.astype(np.float64)
+        if not len(values) or not reference.sum():
+            continue
+        current = bin_counts(values, np.asarray(histograms[col]['edges'])).astype(np.float64)
+        tests[col] = {'psi': psi(reference, current),
+                      'ks': ks_statistic(reference, current),
+                      'ks_critical': float(ks_critical_value(reference.sum(), current.sum()))}
+    return tests
+
+
+##################Running confusion matrix of the deployed model
+def confusion_counts(y, yhat):
+    """confusion matrix counts of binary predictions"""
+    y = np.asarray(y).astype(bool)
+    yhat = np.asarray(yhat).astype(bool)
+    return {'tp': int((y & yhat).sum()), 'fp': int((~y & yhat).sum()),
+            'fn': int((y & ~yhat).sum()), 'tn': int((~y & ~yhat).sum())}
+
+
+def f1_from_counts(counts):
+    """f1 score from confusion matrix counts"""
+    denominator = 2 * counts['tp'] + counts['fp'] + counts['fn']
+    return 2 * counts['tp'] / denominator if denominator else 0.0
+
+
+def read_state(statepath):
+    if not os.path.exists(statepath):
+        return None
+    with open(statepath, 'r') as f:
+        return json.load(f)
+
+
+def write_state(statepath, state):
+    with open(statepath + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(statepath + '.tmp', statepath)
+
+
+def score_master():
+    """confusion matrix counts of the deployed model over the whole master dataset
+    the cached feature matrix of the master dataset is scored in chunks
+    """
+    model = deployed_model()
+    X, y = master_features()
+    chunksize = config.get('chunksize', 100000)
+    counts = {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0}
+    for start in range(0, len(y), chunksize):
+        yhat = model.predict(model_input(model, X[start:start + chunksize]))
+        for key, value in confusion_counts(y[start:start + chunksize], yhat).items():
+            counts[key] += value
+    return counts
+
+
+##################Function for drift detection
+def check_drift(newdata):
+    """
+    decide whether the deployed model drifted using only newly ingested rows
+    - distribution drift: a predictor of the new rows fails the KS test against its
+      training histogram and its PSI exceeds drift_psi_threshold
+    - performance drift: the F1 score of the running confusion matrix over all
+      ingested rows falls below the deployed latest score
+    the running confusion matrix is updated with the new rows only; the master
+    dataset is scored again after a new model is deployed or when ingestion
+    rewrote it (see ingestion.dataset_base)
+    input: dataframe of rows appended by ingestion.merge_multiple_dataframe
+    output: drift report (dict)
+    """
+    report = {'rows': len(newdata), 'reasons': []}
+
+    # every artifact of the deployed model is read from the same registry version
+    snapshot = registry.current_path()
+
+    # cheap distribution tests against training histograms
+    histogrampath = os.path.join(snapshot, 'referencehistograms.json')
+    if os.path.exists(histogrampath) and len(newdata):
+        with open(histogrampath, 'r') as f:
+            histograms = json.load(f)
+        report['distribution'] = distribution_tests(newdata, histograms)
+        threshold = config.get('drift_psi_threshold', 0.25)
+        for col, test in report['distribution'].items():
+            if test['ks'] > test['ks_critical'] and test['psi'] > threshold:
+                report['reasons'].append(f'distribution drift on {col}')
+
+    # running confusion matrix of the deployed model
+    model_version = registry.current_version() or manifest.file_digest(os.path.join(snapshot, 'trainedmodel.pkl'))
+    statepath = os.path.join(model_path, 'driftstate.json')
+    state = read_state(statepath)
+    base = dataset_base()
+    if state is None or state['model_version'] != model_version or state.get('dataset_base') != base:
+        # new model, or master dataset rewritten (keep-latest removed rows):
+        # score the whole master dataset once, it includes newdata
+        state = {'model_version': model_version, 'dataset_base': base, 'counts': score_master()}
+    elif len(newdata):
+        new_counts = confusion_counts(newdata['exited'], model_predictions(newdata))
+        for key, value in new_counts.items():
+            state['counts'][key] += value
+    write_state(statepath, state)
+
+    scorespath = os.path.join(snapshot, 'latestscore.txt')
+    with open(scorespath, 'r') as f:
+        report['latest score'] = ast.literal_eval(f.read())
+    report['new score'] = f1_from_counts(state['counts'])
+    if report['new score'] < report['latest score']:
+        report['reasons'].append('performance drift')
+
+    report['drift'] = bool(report['reasons'])
+    return report
@@ -0,0 +1,146 @@
+import os
+import json
+import threading
+import numpy as np
+
+from features import file_version, model_input, test_features
+from model_cache import get_model
+from instrumentation import instrument, record_rows
+
+##################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+model_path = os.path.join(config['output_model_path'])
+test_data_path = os.path.join(config['test_data_path'])
+evaluations_path = os.path.join(model_path, 'evaluations.json')
+
+# number of (model version, test set version) results kept in evaluations.json
+max_evaluations = 20
+
+memo = {}
+memo_lock = threading.Lock()
+
+
+##################Vectorized metrics
+def binary_metrics(y, yhat, probabilities):
+    """compute the metric bundle of binary predictions in one pass
+    input: true labels, predicted labels and predicted probabilities of the positive class
+    output: dict with confusion matrix, accuracy, precision, recall, f1 and roc auc
+    """
+    y = np.asarray(y).astype(bool)
+    yhat = np.asarray(yhat).astype(bool)
+    # confusion counts from a single bincount over 2 * y + yhat
+    tn, fp, fn, tp = np.bincount(2 * y.astype(np.int64) + yhat, minlength=4).tolist()
+
+    ratio = lambda num, den: num / den if den else 0.0
+    precision = ratio(tp, tp + fp)
+    recall = ratio(tp, tp + fn)
+    return {'rows': len(y),
+            'confusion matrix': [[tn, fp], [fn, tp]],
+            'accuracy': ratio(tp + tn, len(y)),
+            'precision': precision,
+            'recall': recall,
+            'f1': ratio(2 * tp, 2 * tp + fp + fn),
+            'roc auc': roc_auc(y, probabilities),
+            'classification report': classification_report(tn, fp, fn, tp)}
+
+
+def roc_auc(y, probabilities):
+    """area under the ROC curve from the average ranks of positive rows
+    (Mann-Whitney U statistic, ties counted as one half)
+    output: roc auc, None when the labels hold a single class
+    """
+    positives = int(y.sum())
+    negatives = len(y) - positives
+    if not positives or not negatives:
+        return None
+    values, inverse, counts = np.unique(probabilities, return_inverse=True, return_counts=True)
+    # average 1-based rank of each distinct value
+    ranks = np.cumsum(counts) - (counts - 1) / 2
+    rank_sum = ranks[inverse][y].sum()
+    return float((rank_sum - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def classification_report(tn, fp, fn, tp):
+    """per class and averaged precision, recall and f1 in the format of
+    sklearn.metrics.classification_report(output_dict=True)
+    """
+    ratio = lambda num, den: num / den if den else 0.0
+    report = {}
+    for label, (true, false_pos, false_neg) in {'0': (tn, fn, fp), '1': (tp, fp, fn)}.items():
+        report[label] = {'precision': ratio(true, true + false_pos),
+                         'recall': ratio(true, true + false_neg),
+                         'f1-score': ratio(2 * true, 2 * true + false_pos + false_neg),
+                         'support': true + false_neg}
+    total = tn + fp + fn + tp
+    report['accuracy'] = ratio(tn + tp, total)
+    for average, weights in [('macro avg', (1, 1)),
+                             ('weighted avg', (report['0']['support'], report['1']['support']))]:
+        report[average] = {metric: ratio(sum(w * report[label][metric]
+                                             for w, label in zip(weights, ['0', '1'])), sum(weights))
+                           for metric in ['precision', 'recall', 'f1-score']}
+        report[average]['support'] = total
+    return report
+
+
+##################Evaluation cache
+def read_evaluations():
+    if not os.path.exists(evaluations_path):
+        return {}
+    with open(evaluations_path, 'r') as f:
+        return json.load(f)
+
+
+def write_evaluations(evaluations):
+    # keep the most recent evaluations only, dicts preserve insertion order
+    evaluations = dict(list(evaluations.items())[-max_evaluations:])
+    with open(evaluations_path + '.tmp', 'w') as f:
+        json.dump(evaluations, f, indent=1)
+    os.replace(evaluations_path + '.tmp', evaluations_path)
+
+
+@instrument('evaluation')
+def compute_evaluation(modelpath, testpath):
+    """predict the test set once and compute the metric bundle
+    input: paths of the model and of the test dataset
+    output: metric bundle (dict)
+    """
+    # cached feature matrix of the test set, see features.py
+    X, y = test_features(testpath)
+    record_rows(len(X))
+
+    model = get_model(modelpath)
+    probabilities = model.predict_proba(model_input(model, X))[:, 1]
+    # same decision as model.predict for binary classifiers, without a second pass
+    yhat = model.classes_[(probabilities > 0.5).astype(np.int64)]
+    return binary_metrics(y, yhat, probabilities)
+
+
+def evaluate(modelpath=None, testpath=None):
+    """
+    evaluate a model on the test dataset, once per (model version, test set version)
+    results are persisted in evaluations.json so that scoring, reporting and the
+    API read the same bundle instead of predicting again; since versions are
+    content hashes, a trained model and its deployed copy share their evaluation
+    input (optional): model path, trainedmodel.pkl of the model folder by default
+                      and test dataset path, testdata.csv by default
+    output: metric bundle (dict)
+    """
+    modelpath = modelpath or os.path.join(model_path, 'trainedmodel.pkl')
+    testpath = testpath or os.path.join(test_data_path, 'testdata.csv')
+    key = f'{file_version(modelpath)}:{file_version(testpath)}'
+
+    with memo_lock:
+        if key in memo:
+            return memo[key]
+        evaluations = read_evaluations()
+        if key not in evaluations:
+            evaluations[key] = compute_evaluation(modelpath, testpath)
+            write_evaluations(evaluations)
+        memo[key] = evaluations[key]
+        return memo[key]
+
+
+if __name__ == '__main__':
+    print(json.dumps(evaluate(), indent=1))
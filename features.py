@@ -0,0 +1,155 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+import manifest
+from ingestion import read_master, iter_master, read_csv, dataset_version
+
+###################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+test_data_path = os.path.join(config['test_data_path'])
+# feature matrices are cached next to the master dataset by default
+feature_cache_path = config.get('feature_cache_path') or os.path.join(config['output_folder_path'], 'features')
+
+# columns used by the model, target variable last
+FEATURES = ['lastmonth_activity','lastyear_activity','number_of_employees','exited']
+PREDICTORS = FEATURES[:-1]
+TARGET = FEATURES[-1]
+
+# content hashes of cached files, recomputed only when size or mtime change
+file_entries = {}
+
+
+##################Feature matrices
+# models are fitted and scored on a contiguous float64 predictor matrix X (columns
+# in PREDICTORS order) and a target vector y; the matrices of the master dataset
+# and of test files are built once per data version and saved as .npy files, which
+# are memory-mapped by every later training, scoring or diagnostics run
+#
+# cache layout: <feature_cache_path>/<name>-<version>/X.npy and y.npy, where name
+# is 'master' or 'test-<file name>' and version is the master dataset version or
+# the content hash of the test file; older versions of a name are removed
+
+def to_matrix(dataset):
+    """ predictor matrix and target vector of a dataframe
+    input: dataframe holding the FEATURES columns
+    output: X float64 array of shape (n_rows, n_predictors) and y array
+    """
+    X = np.ascontiguousarray(dataset[PREDICTORS].to_numpy(dtype=np.float64))
+    y = dataset[TARGET].to_numpy()
+    return X, y
+
+
+def model_input(model, X):
+    """ predictor matrix in the form a model expects
+    sklearn models fitted with feature names warn on bare arrays, they get a
+    dataframe over the same memory instead
+    input: model and predictor matrix
+    output: X or a dataframe view of X
+    """
+    if hasattr(model, 'feature_names_in_'):
+        return pd.DataFrame(X, columns=model.feature_names_in_, copy=False)
+    return X
+
+
+def file_version(filepath):
+    """content hash of a file, cached while its size and mtime are unchanged"""
+    folder, file = os.path.split(os.path.abspath(filepath))
+    entry = manifest.file_entry(folder, file, file_entries.get(filepath))
+    file_entries[filepath] = entry
+    return entry['hash']
+
+
+def load_matrix(folder):
+    """ memory-map a cached feature matrix, None if it is not cached """
+    if not os.path.exists(os.path.join(folder, 'y.npy')):
+        return None
+    return (np.load(os.path.join(folder, 'X.npy'), mmap_mode='r'),
+            np.load(os.path.join(folder, 'y.npy'), mmap_mode='r'))
+
+
+def save_matrix(name, version, write):
+    """ build a feature matrix in a private temporary folder, then publish it
+    input: cache name, data version and function writing X.npy and y.npy into a folder
+    output: memory-mapped X and y
+    """
+    folder = os.path.join(feature_cache_path, f'{name}-{version}')
+    os.makedirs(feature_cache_path, exist_ok=True)
+    # one folder per build, so concurrent builds never touch each other's files
+    tmppath = tempfile.mkdtemp(prefix=f'{name}-{version}.', suffix='.tmp', dir=feature_cache_path)
+    os.chmod(tmppath, 0o755)
+    try:
+        write(tmppath)
+        # readers only see complete folders; keep the copy of a concurrent build
+        os.rename(tmppath, folder)
+    except OSError:
+        if not os.path.exists(os.path.join(folder, 'y.npy')):
+            raise
+    finally:
+        shutil.rmtree(tmppath, ignore_errors=True)
+
+    # drop the previous versions, open memory maps stay readable;
+    # builds in progress (.tmp folders) belong to other processes;
+    # versions hold no '-', so 'test-foo' never matches 'test-foo-bar-<version>'
+    for entry in os.listdir(feature_cache_path):
+        if (entry.rsplit('-', 1)[0] == name and not entry.endswith('.tmp')
+                and entry != os.path.basename(folder)):
+            shutil.rmtree(os.path.join(feature_cache_path, entry), ignore_errors=True)
+    return load_matrix(folder)
+
+
+def write_master_matrix(folder):
+    """ write the matrix of the master dataset chunk by chunk with bounded memory """
+    y = read_master([TARGET])[TARGET].to_numpy()
+    X = np.lib.format.open_memmap(os.path.join(folder, 'X.npy'), mode='w+',
+                                  dtype=np.float64, shape=(len(y), len(PREDICTORS)))
+    start = 0
+    for chunk in iter_master(PREDICTORS):
+        X[start:start + len(chunk)] = chunk.to_numpy(dtype=np.float64)
+        start += len(chunk)
+    X.flush()
+    del X
+    np.save(os.path.join(folder, 'y.npy'), y)
+
+
+def master_features():
+    """ feature matrix of the master dataset, cached per dataset version
+    input: None
+    output: X and y, memory-mapped read-only
+    """
+    version = dataset_version()
+    if version is None:
+        # unversioned master dataset: nothing to key the cache on
+        return to_matrix(read_master(FEATURES))
+    cached = load_matrix(os.path.join(feature_cache_path, f'master-{version}'))
+    return cached if cached is not None else save_matrix('master', version, write_master_matrix)
+
+
+def test_features(filepath=None):
+    """ feature matrix of a test file, cached per file content
+    input (optional): path of the test file, testdata.csv by default
+    output: X and y, memory-mapped read-only
+    """
+    filepath = filepath or os.path.join(test_data_path, 'testdata.csv')
+    name = 'test-' + os.path.splitext(os.path.basename(filepath))[0]
+    version = file_version(filepath)[:16]
+    cached = load_matrix(os.path.join(feature_cache_path, f'{name}-{version}'))
+    if cached is not None:
+        return cached
+
+    def write(folder):
+        X, y = to_matrix(read_csv(filepath))
+        np.save(os.path.join(folder, 'X.npy'), X)
+        np.save(os.path.join(folder, 'y.npy'), y)
+    return save_matrix(name, version, write)
+
+
+if __name__ == '__main__':
+    # materialize the matrices of the current master dataset and test file
+    for X, y in [master_features(), test_features()]:
+        print(X.shape, X.dtype, y.dtype)
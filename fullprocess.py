@@ -1,16 +1,14 @@
+import time
+start_time = time.perf_counter()
 
 import json
-import os
-import ast
-from sklearn import metrics
 import logging
 
-import training
-import scoring
-import deployment
-import diagnostics
-import reporting
-import ingestion
+# light modules only: heavy modules (pandas, sklearn, matplotlib) are imported
+# on the branches that need them, so a cron tick without new data ends quickly
+import manifest
+import registry
+from instrumentation import stage
 
 # Initialize logging
 logging.basicConfig(filename='journal.log',
@@ -27,80 +25,95 @@ output_folder_path = config['output_folder_path']
 prod_deployment_path = config['prod_deployment_path']
 model_path = config['output_model_path']
 
-move_to_next_step = False
-logging.info("Launching automated monitoring")
-##################Check and read new data
-#first, read ingestedfiles.txt
-filepath = os.path.join(prod_deployment_path,'ingestedfiles.txt')
-with open(filepath, 'r') as f:
-    ingestedfiles = ast.literal_eval(f.read())
-
-#second, determine whether the source data folder has files that aren't listed in ingestedfiles.txt
-files = os.listdir(input_folder_path)
-files = [file for file in files if file not in ingestedfiles]
-
-##################Deciding whether to proceed, part 1
-#if you found new data, you should proceed. otherwise, do end the process here
-if files !=[]:
+
+def main():
+    logging.info("Launching automated monitoring")
+    ##################Check and read new data
+    #first, read ingestedfiles.txt of the deployed model version
+    #a legacy manifest listing file names only counts its files as ingested, so a
+    #deployment made before content hashes were recorded still ends here quickly
+    filepath = registry.artifact_path('ingestedfiles.txt')
+    ingestedfiles = manifest.read_manifest(filepath)
+
+    #second, determine whether the source data folder has files that are new or changed since ingestedfiles.txt
+    _, files = manifest.scan_folder(input_folder_path, ingestedfiles)
+
+    ##################Deciding whether to proceed, part 1
+    #if you found new data, you should proceed. otherwise, do end the process here
+    if files == []:
+        logging.info("No new files - ending process "
+                     f"({time.perf_counter() - start_time:.3f} sec since start)")
+        return
+
+    import ingestion
+    import diagnostics
+    import training
+
     logging.info("ingesting new files")
-    ingestion.merge_multiple_dataframe()
-    move_to_next_step = True
-else:
-    logging.info("No new files - ending process")
-##################Checking for model drift
-"""There are two possible scenarios here:
-- We train a new model on new data and then compare the performance of the new model 
-and the existing model on the test data we set aside before.
-- We evaluate our existing model on the new data we have. If its performance falls 
-below its recorded performance on test data, we train a new model on the new data and deploy it.
-
-In the first case, we cannot explicitly say that the existing model drifted. 
-The model trained on new data simply performed better when evaluated on the same test data. 
-Whereas in the second scenario, the performance of our existing model degraded 
-on new data prompting us to train another model on the new data."""
-
-"""You can manually change the dataset instead the latest score and 
-get an worse result only to make sure your code runs fine."""
-
-#check whether the score from the deployed model is different from the score from the model that uses the newest ingested data
-if move_to_next_step:
-    scorespath = os.path.join(prod_deployment_path, 'latestscore.txt')
-    with open(scorespath, 'r') as f:
-         latest_score = ast.literal_eval(f.read())
-    
-    filepath = os.path.join(output_folder_path,'finaldata.csv')
-    dataset = ingestion.read_csv(filepath)
-    new_yhat = diagnostics.model_predictions(dataset)
-    new_y = ingestion.read_csv(filepath)['exited']
-    new_score = metrics.f1_score(new_y, new_yhat)
-    logging.info(f'latest score: {latest_score}, new score: {new_score}')
-
-    if new_score >= latest_score:
-        move_to_next_step = False  # No model drift, keep existing model
+    newdata = ingestion.merge_multiple_dataframe()
+    diagnostics.summary_statistics()  # refresh statistics cache for the new data version
+
+    ##################Checking for model drift
+    """There are two possible scenarios here:
+    - We train a new model on new data and then compare the performance of the new model 
+    and the existing model on the test data we set aside before.
+    - We evaluate our existing model on the new data we have. If its performance falls 
+    below its recorded performance on test data, we train a new model on the new data and deploy it.
+
+    In the first case, we cannot explicitly say that the existing model drifted. 
+    The model trained on new data simply performed better when evaluated on the same test data. 
+    Whereas in the second scenario, the performance of our existing model degraded 
+    on new data prompting us to train another model on the new data."""
+
+    """You can manually change the dataset instead the latest score and 
+    get an worse result only to make sure your code runs fine."""
+
+    #check whether the score from the deployed model is different from the score from the model that uses the newest ingested data
+    #only the newly ingested rows are scored, see drift.py
+    import drift
+
+    report = drift.check_drift(newdata)
+    logging.info(f"latest score: {report['latest score']}, new score: {report['new score']}")
+    for col, test in report.get('distribution', {}).items():
+        logging.info(f"{col}: psi {test['psi']:.3f}, ks {test['ks']:.3f} (critical {test['ks_critical']:.3f})")
+
+    if not report['drift']:
+        # No model drift, keep existing model
         logging.info('No model drift - ending process')
+        return
+
+    ##################Deciding whether to proceed, part 2
+    #if you found model drift, you should proceed. otherwise, do end the process here
+    import scoring
 
-##################Deciding whether to proceed, part 2
-#if you found model drift, you should proceed. otherwise, do end the process here
-if move_to_next_step:  # model drift, move to retraining
+    logging.info(f"model drift: {', '.join(report['reasons'])}")
     logging.info('training new model')
     training.train_model()
     scoring.score_model()
 
-##################Re-deployment
-#if you found evidence for model drift, re-run the deployment.py script
-if move_to_next_step:
+    ##################Re-deployment
+    #if you found evidence for model drift, re-run the deployment.py script
+    import deployment
+
     logging.info('deploying new model')
     deployment.store_model_into_pickle()
 
-##################Diagnostics and reporting
-#run diagnostics.py and reporting.py for the re-deployed model
-if move_to_next_step:
+    ##################Diagnostics and reporting
+    #run diagnostics.py and reporting.py for the re-deployed model
+    import reporting
+    import apiclient
+
     logging.info('producing reporting and calling apis for statistics')
     reporting.score_model()
-    os.system('python apicalls.py')
-
-
-
-
-
-
+    #the endpoints are called concurrently, in-process
+    responses = apiclient.collect()
+    apiclient.write_returns(responses)
+    for name, response in responses.items():
+        if 'error' in response or response['status'] >= 400:
+            logging.warning(f"api call {name} failed: {response.get('error', response['status'])}")
+
+
+if __name__ == '__main__':
+    # each run is recorded in the stage metrics history, including no-op ticks
+    with stage('monitoring'):
+        main()
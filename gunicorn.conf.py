@@ -0,0 +1,32 @@
+import os
+import gc
+import json
+import multiprocessing
+
+##################Load config.json and get serving variables
+# not named config: module level names of this file are read as gunicorn settings
+with open('config.json','r') as f:
+    project_config = json.load(f)
+
+# gunicorn settings, used by: gunicorn wsgi:app
+# environment variables GUNICORN_WORKERS, GUNICORN_THREADS and GUNICORN_BIND take precedence
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS') or project_config.get('serving_workers')
+              or multiprocessing.cpu_count())
+# requests are mostly numpy calls and file reads, which release the GIL
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS') or project_config.get('serving_threads', 4))
+timeout = 60
+
+# import the app once in the master: pandas, numpy, the deployed model and the
+# cached statistics are then shared copy-on-write by the forked workers
+preload_app = True
+
+
+def when_ready(server):
+    # runs in the master after the app is preloaded and before workers are forked
+    import app
+    app.warm_caches()
+    # move the objects loaded so far out of the garbage collector's reach, so that
+    # collections in the workers do not write to (and copy) the shared pages
+    gc.freeze()
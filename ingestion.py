@@ -1,8 +1,16 @@
 import pandas as pd
+import numpy as np
 import os
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 
+import manifest
+import storage
+import dedup
+from instrumentation import instrument, record_rows
+
 
 #############Load config.json and get input and output paths
 with open('config.json','r') as f:
@@ -11,6 +19,18 @@ with open('config.json','r') as f:
 input_folder_path = config['input_folder_path']
 output_folder_path = config['output_folder_path']
 
+# storage backend of the master dataset
+store = storage.get_store(config.get('dataset_format', 'csv'))
+master_path = os.path.join(output_folder_path, 'finaldata' + store.extension)
+version_path = os.path.join(output_folder_path, 'datasetversion.txt')
+base_path = os.path.join(output_folder_path, 'datasetbase.txt')
+
+# dedup policy of ingested rows and key columns of the keep-first and keep-latest policies, see dedup.py
+# ingestion cost scales with new data, except when keep-latest replaces ingested
+# rows: the master dataset is then read and rewritten once for the batch
+dedup_policy = config.get('dedup_policy', 'exact')
+dedup_key = config.get('dedup_key', ['corporation'])
+
 # get current directory
 working_dir = os.getcwd()
 # get current date
@@ -18,46 +38,198 @@ today = datetime.today().strftime('%Y%m%d')
 
 def read_csv(filename):
     """ read a csv file using filename
+    columns of the master dataset schema are interned and downcast
     input: filenames to read
-    output: dataframe
+    output: dataframe typed as per storage.SCHEMA
+    """
+    return storage.apply_schema(pd.read_csv(filename))
+
+
+def read_master(columns=None, start=0):
+    """ read the master dataset from the configured store
+    input: optional list of columns to read, all columns by default
+           and optional index of the first row to read
+    output: dataframe typed as per storage.SCHEMA
+    """
+    return store.read(master_path, columns, start=start)
+
+
+def iter_master(columns=None, chunksize=None):
+    """ read the master dataset chunk by chunk with bounded memory
+    input: optional list of columns and number of rows per chunk
+    output: iterator of dataframes typed as per storage.SCHEMA
+    """
+    chunksize = chunksize or config.get('chunksize', 100000)
+    return store.iter_chunks(master_path, columns, chunksize)
+
+
+def dataset_version():
+    """ read the version of the master dataset
+    the version changes every time ingestion adds rows to the master dataset
+    input: None
+    output: version string, None if the master dataset was never versioned
+    """
+    if not os.path.exists(version_path):
+        return None
+    with open(version_path, 'r') as f:
+        return f.read().strip()
+
+
+def write_dataset_version(version):
+    """ save the version of the master dataset atomically """
+    with open(version_path + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(version_path + '.tmp', version_path)
+
+
+def dataset_base():
+    """ read the version of the master dataset when it was last rewritten
+    rows are only appended to the master dataset between rewrites, so row
+    positions are stable while the base is unchanged
+    input: None
+    output: version string, None if the master dataset was never rewritten
     """
-    return pd.read_csv(filename)
+    if not os.path.exists(base_path):
+        return None
+    with open(base_path, 'r') as f:
+        return f.read().strip()
+
+
+def read_source_file(filepath, chunksize=None):
+    """ parse one source file into a typed, deduplicated dataframe
+    runs in an ingestion worker
+    input: path of the source file and number of rows parsed at a time
+    output: dataframe typed as per storage.SCHEMA and its hashes as per dedup_policy
+    """
+    if chunksize:
+        chunks = pd.read_csv(filepath, chunksize=chunksize)
+        dataset = pd.concat(chunks, axis=0, ignore_index=True)
+    else:
+        dataset = pd.read_csv(filepath)
+    # columns in schema order so identical rows hash identically across files
+    dataset = storage.apply_schema(dataset.reindex(columns=list(storage.SCHEMA)))
+
+    hashes = dedup.dataset_hashes(dataset, dedup_policy, dedup_key)
+    keep, _ = dedup.deduplicate(hashes, np.empty(0, dtype=np.uint64), dedup_policy)
+    return dataset[keep], hashes[keep]
+
+
+def read_source_files(filepaths):
+    """ parse source files concurrently
+    ingestion_workers sets the pool size and ingestion_executor the pool type:
+    'thread' for I/O-bound work, 'process' for parse-bound work
+    input: list of source file paths
+    output: list of (dataframe, row hashes), in the order of filepaths
+    """
+    workers = min(config.get('ingestion_workers', 1), len(filepaths))
+    chunksize = config.get('chunksize')
+    if workers <= 1:
+        return [read_source_file(filepath, chunksize) for filepath in filepaths]
+
+    executor = ProcessPoolExecutor if config.get('ingestion_executor') == 'process' else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        return list(pool.map(read_source_file, filepaths, [chunksize] * len(filepaths)))
+
 
 #############Function for data ingestion
-def merge_multiple_dataframe():
+@instrument('ingestion')
+def merge_multiple_dataframe(full_refresh=False):
     """ 
     combine multiple datasets into one master file
+    only new or changed source files are parsed and only unseen rows are appended,
+    duplicates are resolved as per dedup_policy (see dedup.py); with keep-latest,
+    the master file is rewritten when new rows replace ingested ones
     record ingested files and save to disk
-    input: None
-    output: Master dataset and list of ingested files saved to disk
+    input: full_refresh, rebuild the master file from all source files
+    output: Master dataset and manifest of ingested files saved to disk
+            returns the dataframe of newly appended rows
     """
 
-    # master dataset placeholder
-    finaldata = pd.DataFrame()
-    # ingested files placeholder
-    ingestedfiles = []
+    manifestpath = os.path.join(output_folder_path,'ingestedfiles.txt')      # f'{today}_ingestedfiles.txt'
+    indexpath = os.path.join(output_folder_path, dedup.index_filename(dedup_policy))
+    # master row of every indexed key, key policies only
+    positionspath = os.path.join(output_folder_path, 'keyrows.npy')
+
+    # start over when the master file or its row index is not available
+    rebuild = (full_refresh or not store.exists(master_path)
+                    or not os.path.exists(indexpath))
+
+    # find new or changed source files
+    previous = {} if rebuild else manifest.read_manifest(manifestpath)
+    ingestedfiles, files = manifest.scan_folder(input_folder_path, previous)
+
+    # parse new datasets in parallel then compile them together
+    results = read_source_files([os.path.join(input_folder_path,file) for file in files])
+    if results:
+        # categories differ between files, concatenated categoricals are interned again
+        newdata = storage.apply_schema(pd.concat([frame for frame, _ in results], axis=0, ignore_index=True))
+        hashes = np.concatenate([frame_hashes for _, frame_hashes in results])
+    else:
+        newdata = storage.apply_schema(pd.DataFrame(columns=list(storage.SCHEMA)))
+        hashes = np.empty(0, dtype=np.uint64)
+
+    # align columns with the existing master file
+    if not rebuild:
+        newdata = newdata.reindex(columns=store.columns(master_path))
+
+    # drop duplicates across the new files and against the master file
+    index = np.empty(0, dtype=np.uint64) if rebuild else dedup.read_index(indexpath)
+    keep, replacing = dedup.deduplicate(hashes, index, dedup_policy)
+    newdata = newdata[keep]
+    newhashes = hashes[keep]
+
+    positions = None
+    if dedup_policy != 'exact':
+        positions = np.empty(0, dtype=np.int64) if rebuild else dedup.read_positions(positionspath, index)
+        if positions is None:
+            # positions not recorded yet: derived once from the key columns
+            index, positions = dedup.key_positions(read_master(dedup_key), dedup_key)
+
+    master = None
+    replaced = np.empty(0, dtype=np.uint64)
+    removed = np.empty(0, dtype=np.int64)
+    if not rebuild and replacing.any():
+        # keep-latest: rows with a replaced key are removed from the master file
+        master, newdata, newhashes, replaced, removed = dedup.replace_rows(
+            read_master(), newdata, newhashes, replacing, index, positions)
 
-    #check for datasets
-    files = os.listdir(input_folder_path)
+    # write new rows to the output master file
+    if rebuild:
+        store.write(newdata, master_path)
+    elif master is not None:
+        store.write(master, master_path)
+    elif len(newdata):
+        store.append(newdata, master_path)
 
-    # compile datasets together and store ingested file names
-    for file in files:
-        filepath = os.path.join(input_folder_path,file)
-        temp = read_csv(filepath)
-        finaldata = pd.concat([finaldata,temp], axis=0)
-        ingestedfiles.append(file)
+    # save hash index and manifest of ingested files
+    if positions is None:
+        index = np.union1d(index, newhashes)
+    else:
+        index, positions = dedup.update_positions(index, positions, newhashes, removed)
+        dedup.write_index(positionspath, positions)
+    dedup.write_index(indexpath, index)
+    manifest.write_manifest(manifestpath, ingestedfiles)
 
-    # drop duplicates
-    finaldata.drop_duplicates(inplace=True)
+    # version the master dataset: derived from all rows when starting over,
+    # otherwise chained on the previous version and the appended or replaced rows
+    previous_version = None if rebuild else dataset_version()
+    if previous_version is None:
+        rows = newdata if rebuild else read_master()
+        write_dataset_version(hashlib.sha1(np.sort(dedup.row_hashes(rows)).tobytes()).hexdigest()[:16])
+    elif len(newdata):
+        digest = hashlib.sha1(previous_version.encode())
+        digest.update(newhashes.tobytes())
+        digest.update(replaced.tobytes())
+        write_dataset_version(digest.hexdigest()[:16])
 
-    # write dataset to an output master file
-    savepath = os.path.join(output_folder_path,'finaldata.csv')
-    finaldata.to_csv(savepath, index=False)
+    # record rewrites of the master file, rows were not only appended
+    if rebuild or master is not None:
+        with open(base_path + '.tmp', 'w') as f:
+            f.write(dataset_version())
+        os.replace(base_path + '.tmp', base_path)
 
-    # save ingested files with timestamp
-    savepath = os.path.join(output_folder_path,'ingestedfiles.txt')      # f'{today}_ingestedfiles.txt'
-    with open(savepath, 'w') as f:
-        f.write(str(ingestedfiles))
+    record_rows(len(newdata))
+    return newdata
 
     
 
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+##################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+metrics_path = os.path.join(config['output_model_path'], 'stagemetrics.jsonl')
+# last successful record of every stage, read by diagnostics and reporting
+latest_path = os.path.join(config['output_model_path'], 'stagelatest.json')
+# size above which the history is rotated to stagemetrics.jsonl.1
+max_history_bytes = config.get('stage_metrics_max_bytes', 10 * 1024 * 1024)
+
+# stages currently running in this thread, innermost last
+running = threading.local()
+write_lock = threading.Lock()
+
+# peak rss of every stage running in any thread, see stage_memory_start
+active_peaks = {}
+memory_lock = threading.Lock()
+
+
+##################Stage memory
+# linux tracks the peak rss of a process (VmHWM) and resets it to the current rss
+# when 5 is written to /proc/self/clear_refs. A stage resets it when it starts, after
+# folding the peak reached so far into every running stage, and reads it when it
+# ends, so each stage records the peak reached while it ran rather than since the
+# process started. RSS is process-wide: stages running concurrently in other
+# threads count towards each other's peak.
+# Without /proc (macos, windows) the process-lifetime peak is recorded instead.
+def read_status_mb(field):
+    """current (VmRSS) or peak (VmHWM) rss of the process in MB, None without /proc"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    # values are in kB
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """reset the peak rss of the process to its current rss, False if not supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def process_peak_rss_mb():
+    """peak resident set size of the process since it started, in MB"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stage_memory_start(key):
+    """start tracking the peak rss of a stage
+    input: key identifying the running stage
+    output: rss of the process in MB when the stage starts
+    """
+    with memory_lock:
+        peak = read_status_mb('VmHWM')
+        if peak is not None and reset_peak_rss():
+            for other in active_peaks:
+                active_peaks[other] = max(active_peaks[other], peak)
+            active_peaks[key] = 0
+        return read_status_mb('VmRSS')
+
+
+def stage_memory_end(key, start_rss):
+    """stop tracking the peak rss of a stage
+    input: key identifying the running stage and its rss when it started
+    output: dict of the peak rss reached during the stage and the rss change, in MB
+    """
+    with memory_lock:
+        peak = read_status_mb('VmHWM')
+        if key in active_peaks:
+            peak = max(active_peaks.pop(key), peak)
+        else:
+            # peak cannot be reset: process-lifetime peak
+            peak = process_peak_rss_mb()
+        rss = read_status_mb('VmRSS')
+    return {'peak_rss_mb': peak,
+            'rss_delta_mb': rss - start_rss if rss is not None and start_rss is not None else None}
+
+
+##################Stage instrumentation
+@contextmanager
+def stage(name):
+    """measure a pipeline stage and append its metrics to the history
+    records wall time, cpu time, peak rss reached during the stage, change in rss
+    and rows processed
+    usage:
+        with stage('ingestion') as record:
+            ...
+            record['rows'] = len(dataset)
+    """
+    record = {'stage': name, 'rows': None}
+    stack = running.__dict__.setdefault('stack', [])
+    stack.append(record)
+    start_rss = stage_memory_start(id(record))
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    status = 'error'
+    try:
+        yield record
+        status = 'ok'
+    finally:
+        stack.pop()
+        record.update({'timestamp': datetime.now().isoformat(timespec='seconds'),
+                       'status': status,
+                       'wall_time': time.perf_counter() - start_wall,
+                       'cpu_time': time.process_time() - start_cpu})
+        record.update(stage_memory_end(id(record), start_rss))
+        write_record(record)
+
+
+def instrument(name):
+    """decorator measuring every call of a function as a pipeline stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_rows(rows):
+    """set the number of rows processed by the innermost running stage"""
+    stack = getattr(running, 'stack', None)
+    if stack:
+        stack[-1]['rows'] = int(rows)
+
+
+##################Metrics history
+# every record is appended to stagemetrics.jsonl, rotated once it exceeds
+# stage_metrics_max_bytes, and the last successful record of its stage is kept
+# in stagelatest.json so readers never parse the history
+def write_record(record):
+    with write_lock:
+        if os.path.exists(metrics_path) and os.path.getsize(metrics_path) > max_history_bytes:
+            os.replace(metrics_path, metrics_path + '.1')
+        with open(metrics_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        if record['status'] == 'ok':
+            latest = read_latest()
+            latest[record['stage']] = record
+            with open(latest_path + '.tmp', 'w') as f:
+                json.dump(latest, f)
+            os.replace(latest_path + '.tmp', latest_path)
+
+
+def read_latest():
+    if not os.path.exists(latest_path):
+        # history recorded before stagelatest.json existed
+        records = {}
+        for record in read_history():
+            if record['status'] == 'ok':
+                records[record['stage']] = record
+        return records
+    with open(latest_path, 'r') as f:
+        return json.load(f)
+
+
+def read_history(name=None):
+    """read recorded stage metrics since the last rotation
+    input: optional stage name to filter on
+    output: list of metric records, oldest first
+    """
+    if not os.path.exists(metrics_path):
+        return []
+    with open(metrics_path, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if name is None or r['stage'] == name]
+
+
+def latest_by_stage():
+    """last successful record of every stage that ran
+    output: dict of metric records keyed by stage name
+    """
+    return read_latest()
+
+
+def metrics_version():
+    """version of the recorded metrics, changes every time a stage succeeds
+    output: modification time of stagelatest.json in ns, None if no stage ran
+    """
+    if not os.path.exists(latest_path):
+        return None
+    return os.stat(latest_path).st_mtime_ns
@@ -0,0 +1,122 @@
+import os
+import json
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+##################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+
+##################Background jobs
+# diagnostics and scoring run on a small worker pool instead of request threads
+# - a job is identified by its kind and the version of its inputs (key)
+# - identical requests submitted while a job is pending or running share that job
+# - results are kept per (kind, key), so a request for unchanged inputs is served
+#   from memory without computing anything
+
+class Job:
+    def __init__(self, kind, key):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = 'pending'
+        self.submitted = datetime.now().isoformat(timespec='seconds')
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """block until the job ended or timeout seconds elapsed
+        output: True if the job ended
+        """
+        return self.done.wait(timeout)
+
+    def to_dict(self):
+        job = {'id': self.id, 'kind': self.kind, 'status': self.status,
+               'submitted': self.submitted, 'finished': self.finished}
+        if self.status == 'done':
+            job['result'] = self.result
+        elif self.status == 'error':
+            job['error'] = self.error
+        return job
+
+
+class JobManager:
+    """worker pool running coalesced, cached jobs"""
+
+    def __init__(self, workers=2, max_results=32, max_jobs=1000):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()      # job id -> Job, oldest first
+        self.running = {}              # (kind, key) -> pending or running Job
+        self.results = OrderedDict()   # (kind, key) -> finished Job, least recently used first
+        self.max_results = max_results
+        self.max_jobs = max_jobs
+
+    def submit(self, kind, key, func):
+        """run func in the background unless its result is known or being computed
+        input: job kind, hashable version of the job inputs and function without arguments
+        output: Job, possibly already done
+        """
+        with self.lock:
+            cached = self.results.get((kind, key))
+            if cached is not None:
+                self.results.move_to_end((kind, key))
+                return cached
+            job = self.running.get((kind, key))
+            if job is not None:
+                return job
+            job = Job(kind, key)
+            self.running[(kind, key)] = job
+            self.jobs[job.id] = job
+            self.trim()
+        self.executor.submit(self.run, job, func)
+        return job
+
+    def run(self, job, func):
+        job.status = 'running'
+        try:
+            job.result = func()
+            job.status = 'done'
+        except Exception as e:
+            job.error = f'{type(e).__name__}: {e}'
+            job.status = 'error'
+        job.finished = datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            del self.running[(job.kind, job.key)]
+            # failed jobs are not cached so that the next request retries
+            if job.status == 'done':
+                self.results[(job.kind, job.key)] = job
+                while len(self.results) > self.max_results:
+                    self.results.popitem(last=False)
+        job.done.set()
+
+    def trim(self):
+        """forget the oldest finished jobs beyond max_jobs"""
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].done.is_set():
+                del self.jobs[job_id]
+
+    def get(self, job_id):
+        """job by id, None if unknown or forgotten"""
+        return self.jobs.get(job_id)
+
+
+def file_version(filepath):
+    """cheap version of a file: size and modification time, None if missing"""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+manager = JobManager(workers=config.get('job_workers', 2))
@@ -0,0 +1,75 @@
+import json
+import numpy as np
+
+
+##################NumPy-only scorer for compact linear model artifacts
+class LinearScorer:
+    """binary linear classifier scored with a single matrix-vector product
+    exposes the predict / predict_proba interface of the sklearn model it
+    was exported from, without importing sklearn
+    """
+    format = 'linear-v1'
+
+    def __init__(self, coef, intercept, features, threshold=0.5, classes=(0, 1), metadata=None):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.features = list(features)
+        self.threshold = threshold
+        self.classes_ = np.asarray(classes)
+        self.metadata = metadata or {}
+
+    @classmethod
+    def from_model(cls, model, metadata=None):
+        """export a fitted sklearn binary linear classifier
+        output: LinearScorer, None if the model is not a binary linear classifier
+        """
+        coef = getattr(model, 'coef_', None)
+        if coef is None or coef.shape[0] != 1 or not hasattr(model, 'feature_names_in_'):
+            return None
+        metadata = dict(metadata or {}, estimator=type(model).__name__)
+        return cls(coef[0], model.intercept_[0], model.feature_names_in_,
+                   classes=model.classes_.tolist(), metadata=metadata)
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath, 'r') as f:
+            return cls.from_artifact(json.load(f))
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        if artifact.get('format') != cls.format:
+            raise ValueError(f"unsupported model artifact format: {artifact.get('format')}")
+        return cls(artifact['coef'], artifact['intercept'], artifact['features'],
+                   artifact['threshold'], artifact['classes'], artifact['metadata'])
+
+    def save(self, filepath):
+        artifact = {'format': self.format,
+                    'features': self.features,
+                    'coef': self.coef.tolist(),
+                    'intercept': self.intercept,
+                    'threshold': self.threshold,
+                    'classes': self.classes_.tolist(),
+                    'metadata': self.metadata}
+        with open(filepath, 'w') as f:
+            json.dump(artifact, f, indent=1)
+
+    def matrix(self, X):
+        """predictors as a float64 array in feature order
+        dataframes are reordered by column name, arrays are used as given
+        """
+        if hasattr(X, 'columns'):
+            X = X[self.features]
+        return np.asarray(X, dtype=np.float64)
+
+    def decision_function(self, X):
+        return self.matrix(X) @ self.coef + self.intercept
+
+    def predict_proba(self, X):
+        """probabilities of both classes, shape (n_rows, 2) as sklearn"""
+        # logistic function computed without overflow
+        positive = np.exp(-np.logaddexp(0, -self.decision_function(X)))
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X):
+        positive = self.predict_proba(X)[:, 1]
+        return self.classes_[(positive > self.threshold).astype(np.int64)]
@@ -0,0 +1,96 @@
+import os
+import ast
+import json
+import hashlib
+
+
+##################Functions for the ingestion manifest
+def file_digest(filepath, blocksize=1 << 20):
+    """compute the sha256 content hash of a file
+    input: path of the file to hash
+    output: hexadecimal digest
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_entry(folder, file, previous=None):
+    """describe a source file by name, size, mtime and content hash
+    the hash of the previous entry is reused when size and mtime are unchanged
+    input: folder, file name and optional previous manifest entry
+    output: manifest entry (dict)
+    """
+    stat = os.stat(os.path.join(folder, file))
+    entry = {'file': file, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    if (previous is not None and previous.get('hash')
+            and previous.get('size') == entry['size']
+            and previous.get('mtime') == entry['mtime']):
+        entry['hash'] = previous['hash']
+    else:
+        entry['hash'] = file_digest(os.path.join(folder, file))
+
+    return entry
+
+
+def read_manifest(filepath):
+    """read an ingestion manifest
+    legacy manifests holding a plain list of file names are supported
+    input: path to ingestedfiles.txt
+    output: dict of manifest entries keyed by file name
+    """
+    if not os.path.exists(filepath):
+        return {}
+
+    with open(filepath, 'r') as f:
+        content = f.read().strip()
+    if not content:
+        return {}
+
+    try:
+        entries = json.loads(content)
+    except ValueError:
+        # legacy format: str(list of file names)
+        entries = ast.literal_eval(content)
+
+    manifest = {}
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'file': entry}
+        manifest[entry['file']] = entry
+    return manifest
+
+
+def write_manifest(filepath, manifest):
+    """write an ingestion manifest atomically
+    input: path to ingestedfiles.txt and dict of manifest entries
+    output: None
+    """
+    tmppath = filepath + '.tmp'
+    with open(tmppath, 'w') as f:
+        json.dump(list(manifest.values()), f, indent=1)
+    os.replace(tmppath, filepath)
+
+
+def scan_folder(folder, manifest):
+    """compare the content of a source folder against a manifest
+    legacy entries (file name only) have no content hash: their files count as
+    ingested and their current size, mtime and hash are recorded
+    input: folder to scan and previous manifest
+    output: updated manifest and sorted list of new or changed files
+    """
+    current = {}
+    changed = []
+    for file in sorted(os.listdir(folder)):
+        if not os.path.isfile(os.path.join(folder, file)):
+            continue
+        previous = manifest.get(file)
+        entry = file_entry(folder, file, previous)
+        current[file] = entry
+        if previous is None or previous.get('hash', entry['hash']) != entry['hash']:
+            changed.append(file)
+
+    return current, changed
@@ -0,0 +1,70 @@
+import os
+import json
+import pickle
+import threading
+
+from linear_scorer import LinearScorer
+
+
+##################In-process cache of deserialized models
+class ModelCache:
+    """keep a deserialized model in memory and reload it when its file is replaced
+    the model file is expected to be replaced atomically (os.replace),
+    so a reader gets either the previous or the new model, never a partial file
+    .json files are compact linear artifacts, .joblib files are loaded with their
+    numpy arrays memory-mapped read-only, other files are pickles
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        # (file version, model) swapped in a single assignment
+        self.loaded = None
+
+    def file_version(self, stat):
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def get(self):
+        """return the cached model, reloading it if the file changed"""
+        version = self.file_version(os.stat(self.filepath))
+        loaded = self.loaded
+        if loaded is not None and loaded[0] == version:
+            return loaded[1]
+
+        with self.lock:
+            loaded = self.loaded
+            if loaded is not None and loaded[0] == version:
+                return loaded[1]
+            with open(self.filepath, 'rb') as f:
+                # version of the file actually opened
+                version = self.file_version(os.fstat(f.fileno()))
+                if self.filepath.endswith('.json'):
+                    model = LinearScorer.from_artifact(json.load(f))
+                elif self.filepath.endswith('.joblib'):
+                    import joblib
+                    # mapping needs the path, deployed artifacts are never rewritten in place
+                    model = joblib.load(self.filepath, mmap_mode='r')
+                else:
+                    model = pickle.load(f)
+            self.loaded = (version, model)
+            return model
+
+
+caches = {}
+caches_lock = threading.Lock()
+
+
+def get_model(filepath):
+    """return the model stored at filepath from the process-wide cache
+    input: path to a pickled model
+    output: deserialized model
+    """
+    filepath = os.path.abspath(filepath)
+    cache = caches.get(filepath)
+    if cache is None:
+        with caches_lock:
+            # forget models whose file is gone, e.g. evicted registry versions
+            for path in [path for path in caches if not os.path.exists(path)]:
+                del caches[path]
+            cache = caches.setdefault(filepath, ModelCache(filepath))
+    return cache.get()
@@ -0,0 +1,179 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime
+
+import manifest
+
+##################Load config.json and get path variables
+with open('config.json','r') as f:
+    config = json.load(f)
+
+prod_deployment_path = os.path.join(config['prod_deployment_path'])
+versions_path = os.path.join(prod_deployment_path, 'versions')
+pointer_path = os.path.join(prod_deployment_path, 'CURRENT')
+history_path = os.path.join(prod_deployment_path, 'history.json')
+
+
+##################Versioned model registry
+# each deployment is an immutable directory versions/<id>, named after the hash
+# of its content; CURRENT holds the id of the promoted version and is replaced
+# atomically, so readers resolving it once get a consistent set of files
+
+def current_version():
+    """id of the promoted version, None before the first registry deployment"""
+    try:
+        with open(pointer_path, 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_path():
+    """directory of the promoted version
+    resolve it once and read every artifact from it to get a consistent snapshot;
+    falls back to the deployment folder itself for deployments made before the registry
+    """
+    version = current_version()
+    if version is None:
+        return prod_deployment_path
+    return os.path.join(versions_path, version)
+
+
+def artifact_path(name):
+    """path of an artifact of the promoted version"""
+    return os.path.join(current_path(), name)
+
+
+def stage():
+    """create an empty staging directory for a new version"""
+    os.makedirs(versions_path, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=versions_path)
+    os.chmod(staging, 0o755)
+    return staging
+
+
+def content_id(directory):
+    """content hash of the files of a directory"""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        digest.update(name.encode())
+        digest.update(manifest.file_digest(os.path.join(directory, name)).encode())
+    return digest.hexdigest()[:16]
+
+
+def publish(staging):
+    """turn a staging directory into an immutable version
+    input: staging directory filled with the artifacts of the deployment
+    output: id of the version
+    """
+    version = content_id(staging)
+    target = os.path.join(versions_path, version)
+    if os.path.exists(target):
+        # same content already published
+        shutil.rmtree(staging)
+    else:
+        os.rename(staging, target)
+    return version
+
+
+def read_history():
+    """promoted versions, oldest first"""
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, 'r') as f:
+        return json.load(f)
+
+
+def write_atomic(filepath, content):
+    with open(filepath + '.tmp', 'w') as f:
+        f.write(content)
+    os.replace(filepath + '.tmp', filepath)
+
+
+def promote(version):
+    """make a published version the current one with a single atomic rename"""
+    if not os.path.isdir(os.path.join(versions_path, version)):
+        raise ValueError(f'unknown model version {version}')
+    write_atomic(pointer_path, version)
+
+    history = read_history()
+    history.append({'version': version,
+                    'promoted': datetime.now().isoformat(timespec='seconds')})
+    write_atomic(history_path, json.dumps(history, indent=1))
+
+
+def rollback(steps=1):
+    """promote again the version deployed before the current one
+    input: number of deployments to go back
+    output: id of the promoted version
+    """
+    previous = []
+    for entry in reversed(read_history()):
+        if not previous or previous[-1] != entry['version']:
+            previous.append(entry['version'])
+    if len(previous) <= steps:
+        raise ValueError('no earlier version to roll back to')
+    version = previous[steps]
+    promote(version)
+    return version
+
+
+def evict(retention=None):
+    """delete versions that are not among the most recently promoted ones
+    input: number of versions to keep, registry_retention from config.json by default
+    output: list of deleted version ids
+    """
+    retention = retention or config.get('registry_retention', 5)
+    keep = {current_version()}
+    for entry in reversed(read_history()):
+        if len(keep) >= retention:
+            break
+        keep.add(entry['version'])
+
+    deleted = []
+    if not os.path.isdir(versions_path):
+        return deleted
+    for version in os.listdir(versions_path):
+        if version.startswith('.') or version in keep:
+            continue
+        shutil.rmtree(os.path.join(versions_path, version), ignore_errors=True)
+        deleted.append(version)
+    return deleted
+
+
+def list_versions():
+    """published versions with their promotion history"""
+    history = read_history()
+    current = current_version()
+    versions = []
+    if os.path.isdir(versions_path):
+        for version in sorted(os.listdir(versions_path)):
+            if version.startswith('.'):
+                continue
+            promoted = [entry['promoted'] for entry in history if entry['version'] == version]
+            versions.append({'version': version, 'current': version == current,
+                             'last promoted': promoted[-1] if promoted else None})
+    return versions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='manage deployed model versions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='list published versions')
+    parser_rollback = subparsers.add_parser('rollback', help='promote the previous version')
+    parser_rollback.add_argument('--steps', type=int, default=1)
+    parser_promote = subparsers.add_parser('promote', help='promote a published version')
+    parser_promote.add_argument('version')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for version in list_versions():
+            print(version)
+    elif args.command == 'rollback':
+        print(rollback(args.steps))
+    else:
+        promote(args.version)
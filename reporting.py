@@ -1,155 +1,183 @@
 import pandas as pd
 import numpy as np
-from sklearn import metrics
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-import seaborn as sns
+import argparse
 import json
 import os
-import ast
+from concurrent.futures import ThreadPoolExecutor
 
-from diagnostics import (model_predictions, dataframe_summary, missing_data, 
-                        execution_time, outdated_packages_list)
-from ingestion import read_csv
+from diagnostics import (summary_statistics, execution_time,
+                        outdated_packages_list, NUMERIC_COLUMNS)
+from evaluation import evaluate
+from manifest import read_manifest
+from instrumentation import instrument
+import registry
+
+# matplotlib is imported by the pdf renderer only, html and json reports
+# are produced without it
 
 ###############Load config.json and get path variables
 with open('config.json','r') as f:
-    config = json.load(f) 
+    config = json.load(f)
 
-dataset_csv_path = os.path.join(config['output_folder_path']) 
+dataset_csv_path = os.path.join(config['output_folder_path'])
 model_path = os.path.join(config['output_model_path'])
 test_data_path = os.path.join(config['test_data_path'])
 
-
-
-
-##############Function for reporting
-def score_model():
-    #calculate a confusion matrix using the test data and the deployed model
-    
-    # collect test dataset
+# figure size of each pdf section, in inches
+FIGSIZES = {'Ingested files': (3,3),
+            'Summary statistics': (10,2),
+            'Confusion matrix': (5,4),
+            'Model metrics': (4,3),
+            'Classification report': (10,5),
+            'Missing data': (4,6),
+            'Execution time': (4,4),
+            'dependencies status': (5,5)}
+
+CLASS_NAMES = ['Not Churned', 'Churned']
+
+
+##############Report content
+def report_sections():
+    """
+    gather the report content from cached artifacts
+    the evaluation, statistics, timings and dependency audit are read from
+    their caches, nothing is recomputed unless a cache is stale
+    output: dict of dataframes keyed by section title, in report order
+    """
+    # evaluation of the deployed model on the test dataset
     datasetpath = os.path.join(test_data_path, 'testdata.csv')
-    dataset = read_csv(datasetpath)
-    # perform prediction
-    yhat = model_predictions(dataset)
-    # calculate confusion matrix
-    y = dataset['exited']
-    cm = metrics.confusion_matrix(y, yhat)
-
-    # Create cm plot
-    f, ax = plt.subplots(figsize=(5,4))
-    sns.heatmap(cm, annot=True,cmap='viridis', fmt='d', linewidths=.5, annot_kws={"fontsize":15})
-    plt.xlabel('Predicted Class', fontsize = 15)
-    ax.xaxis.set_ticklabels(['Not Churned', 'Churned'])
-    plt.ylabel('True Class', fontsize = 15)
-    ax.yaxis.set_ticklabels(['Not Churned', 'Churned'])
-    plt.title('Confusion matrix', fontsize = 20)
-    
-    # write the confusion matrix to the workspace
-    savepath = os.path.join(model_path,'confusionmatrix.png')
-    f.savefig(savepath)
-
-
-
-    # Additional Statistics
-    # compute classification report
-    cr = metrics.classification_report(y, yhat, output_dict=True)
-    # Collect statistics
-    statistics = dataframe_summary()
-    missingdata = missing_data()
-    timings = execution_time()
-    dependencies = outdated_packages_list()
-    # collect ingested files
+    evaluation = evaluate(registry.artifact_path('trainedmodel.pkl'), datasetpath)
+    statistics = summary_statistics()
     filepath = os.path.join(dataset_csv_path,'ingestedfiles.txt')
-    with open(filepath, 'r') as f:
-        ingestedfiles = ast.literal_eval(f.read())
-
-    # Produce pdf report
-    # 1- list of ingested files
-    ingestedfiles = pd.DataFrame(ingestedfiles, columns=['Ingested files'])
-    col_names = ingestedfiles.columns.tolist()
-    data = ingestedfiles.values
-    rowLabels = ingestedfiles.index.tolist()
-    # Plot table
-    fig, ax = plt.subplots(1, figsize=(3,3))
-    plt.title('Ingested files', fontsize = 20)
-    ax.axis('off')
-    table = plt.table(cellText=data, colLabels=col_names, loc='center',colLoc='right', rowLabels=rowLabels)
-    plt.tight_layout()
-
-    # 2- summary statistics
-    col_names = ['lastmonth_activity','lastyear_activity','number_of_employees','exited']
-    data = np.array(statistics).reshape(3,4)
-    # Plot table
-    fig, ax = plt.subplots(1, figsize=(10,2))
-    plt.title('Summary statistics', fontsize = 20)
-    ax.axis('off')
-    table = plt.table(cellText=data, colLabels=col_names, loc='center',colLoc='right',rowLabels=['mean','median','std'])
-
-    # 3- Confusion matrix
-    # Already created above
-
-    # 4- classification report
-    df = pd.DataFrame(cr).transpose()
-    col_names = df.columns.tolist()
-    data = df.values
-    rowLabels = df.index.tolist()
-    # Plot table
-    fig, ax = plt.subplots(1, figsize=(10,5))
-    ax.axis('off')
-    table = plt.table(cellText=data, colLabels=col_names, loc='center',colLoc='right',rowLabels=rowLabels)
-    plt.title('Classification report', fontsize = 20)
-    plt.tight_layout()
-
-    # 5- Missing data
-    df = pd.DataFrame(data=missingdata, index = dataset.columns.tolist(), columns=['missing data'])
-    col_names = df.columns.tolist()
-    data = df.values
-    rowLabels = df.index.tolist()
-    # Plot table
-    fig, ax = plt.subplots(1, figsize=(4,6))
-    ax.axis('off')
-    table = plt.table(cellText=data, colLabels=col_names, loc='center',colLoc='right',rowLabels=rowLabels)
-    plt.title('Missing data', fontsize = 20)
-    plt.tight_layout()
-
-    # 6- Timing of execution
-    timing = pd.DataFrame(timings, columns=['Duration (sec)'])
-    col_names = timing.columns.tolist()
-    data = timing.values
-    rowLabels = ["Ingestion step", 'Training step']
-    # Plot table
-    fig, ax = plt.subplots(1, figsize=(4,4))
-    plt.title('Execution time', fontsize = 20)
-    ax.axis('off')
-    table = plt.table(cellText=data, colLabels=col_names, loc='center',colLoc='right', rowLabels=rowLabels)
-    plt.tight_layout()
-
-    # 7- dependencies status
-    col_names = dependencies.columns.tolist()
-    data = dependencies.values
-    rowLabels = dependencies.index.tolist()
-    # Plot table
-    fig, ax = plt.subplots(1, figsize=(5,5))
-    plt.title('dependencies status', fontsize = 20)
-    ax.axis('off')
-    table = plt.table(cellText=data, colLabels=col_names, loc='center',colLoc='right',rowLabels=rowLabels)
-    plt.tight_layout()
 
+    metrics = ['accuracy', 'precision', 'recall', 'f1', 'roc auc']
+    return {
+        'Ingested files': pd.DataFrame(list(read_manifest(filepath)), columns=['Ingested files']),
+        'Summary statistics': pd.DataFrame([[statistics['statistics'][col][stat] for col in NUMERIC_COLUMNS]
+                                                for stat in ['mean','median','std']],
+                                           index=['mean','median','std'], columns=NUMERIC_COLUMNS),
+        'Confusion matrix': pd.DataFrame(evaluation['confusion matrix'],
+                                         index=CLASS_NAMES, columns=CLASS_NAMES),
+        'Model metrics': pd.DataFrame({'value': [evaluation[m] for m in metrics]}, index=metrics),
+        'Classification report': pd.DataFrame(evaluation['classification report']).transpose(),
+        'Missing data': pd.DataFrame({'missing data': statistics['missing data']}),
+        'Execution time': pd.DataFrame({'Duration (sec)': execution_time()},
+                                       index=['Ingestion step', 'Training step']),
+        'dependencies status': outdated_packages_list(),
+        }
+
+
+##############Pdf rendering
+def table_figure(title, df):
+    """render a dataframe as a table on its own figure"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIGSIZES.get(title, (5,5)))
+    ax = fig.subplots()
+    ax.axis('off')
+    ax.set_title(title, fontsize = 20)
+    cells = df.round(4).astype(str).values if len(df) else [[''] * len(df.columns)]
+    ax.table(cellText=cells, colLabels=df.columns.tolist(), loc='center', colLoc='right',
+             rowLabels=[str(label) for label in df.index] if len(df) else None)
+    fig.tight_layout()
+    return fig
+
+
+def heatmap_figure(title, df):
+    """render the confusion matrix as an annotated heatmap"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIGSIZES[title])
+    ax = fig.subplots()
+    values = df.values
+    image = ax.imshow(values, cmap='viridis')
+    fig.colorbar(image, ax=ax)
+    for (i, j), value in np.ndenumerate(values):
+        color = 'black' if value > values.mean() else 'white'
+        ax.text(j, i, f'{value:d}', ha='center', va='center', fontsize=15, color=color)
+    ax.set_xticks(range(len(df.columns)))
+    ax.set_xticklabels(df.columns)
+    ax.set_yticks(range(len(df.index)))
+    ax.set_yticklabels(df.index)
+    ax.set_xlabel('Predicted Class', fontsize = 15)
+    ax.set_ylabel('True Class', fontsize = 15)
+    ax.set_title(title, fontsize = 20)
+    fig.tight_layout()
+    return fig
+
+
+def render_section(section):
+    title, df = section
+    if title == 'Confusion matrix':
+        return heatmap_figure(title, df)
+    return table_figure(title, df)
+
+
+def write_pdf_report(sections, filename):
+    """
+    render every section on its own figure and write them to a pdf
+    sections are independent and rendered on a thread pool; figures are built
+    with the object oriented api, so they are not registered with pyplot and
+    are released once written
+    """
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with ThreadPoolExecutor(max_workers=config.get('report_workers', 4)) as executor:
+        figures = list(executor.map(render_section, sections.items()))
+
+    with PdfPages(filename) as pp:
+        for title, fig in zip(sections, figures):
+            pp.savefig(fig)
+            if title == 'Confusion matrix':
+                # write the confusion matrix to the workspace
+                fig.savefig(os.path.join(model_path,'confusionmatrix.png'))
+            fig.clear()
+
+
+##############Html and json rendering
+def write_html_report(sections, filename):
+    """write every section as an html table, without matplotlib"""
+    parts = ['<html><head><meta charset="utf-8"><title>Model report</title></head><body>']
+    for title, df in sections.items():
+        parts.append(f'<h2>{title}</h2>')
+        parts.append(df.to_html(float_format=lambda value: f'{value:.4f}', na_rep=''))
+    parts.append('</body></html>')
+    with open(filename, 'w') as f:
+        f.write('\n'.join(parts))
+
+
+def write_json_report(sections, filename):
+    """write every section as json records, without matplotlib"""
+    report = {title: json.loads(df.to_json(orient='index')) for title, df in sections.items()}
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+REPORT_WRITERS = {'pdf': write_pdf_report,
+                  'html': write_html_report,
+                  'json': write_json_report}
 
 
-    def save_multi_image(filename):
-        pp = PdfPages(filename)
-        fig_nums = plt.get_fignums()
-        figs = [plt.figure(n) for n in fig_nums]
-        for fig in figs:
-            fig.savefig(pp, format='pdf')
-        pp.close()
+##############Function for reporting
+@instrument('reporting')
+def score_model(report_format=None):
+    """
+    produce the model report for the deployed model
+    input (optional): report format, pdf, html or json, report_format from config.json by default
+    output: path of the report
+    """
+    report_format = report_format or config.get('report_format', 'pdf')
+    if report_format not in REPORT_WRITERS:
+        raise ValueError(f'unknown report format {report_format}, expected one of {list(REPORT_WRITERS)}')
 
-    filename = "report.pdf"
-    save_multi_image(filename)
+    filename = f'report.{report_format}'
+    REPORT_WRITERS[report_format](report_sections(), filename)
+    return filename
 
 
 
 if __name__ == '__main__':
-    score_model()
+    parser = argparse.ArgumentParser(description='produce the model report')
+    parser.add_argument('--format', choices=list(REPORT_WRITERS), default=None)
+    args = parser.parse_args()
+    score_model(args.format)
@@ -0,0 +1,273 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+
+##################Schema of the master dataset
+# compact column types: strings are interned as categoricals, numeric columns
+# use the narrowest type holding their values exactly (float32 holds integers
+# up to 2**24 and missing values); values that do not fit keep a wider type
+SCHEMA = {'corporation': 'category',
+          'lastmonth_activity': 'float32',
+          'lastyear_activity': 'float32',
+          'number_of_employees': 'float32',
+          'exited': 'uint8'}
+
+# numeric columns of the master dataset
+NUMERIC_COLUMNS = [col for col, dtype in SCHEMA.items()
+                   if pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(dtype))]
+
+
+def downcast(values, dtype):
+    """cast a numeric series to a narrower dtype when no value changes
+    input: series and target dtype
+    output: series of dtype, or of the smallest type holding both dtypes
+            when a value does not survive the cast (out of range, fraction, missing)
+    """
+    dtype = np.dtype(dtype)
+    if values.dtype == dtype:
+        return values
+    try:
+        cast = values.astype(dtype)
+        if np.array_equal(cast.to_numpy(np.float64), values.to_numpy(np.float64), equal_nan=True):
+            return cast
+    except (ValueError, TypeError):
+        # missing values cannot be cast to integers
+        pass
+    return values.astype(np.result_type(dtype, values.dtype))
+
+
+def apply_schema(dataset, columns=None):
+    """cast dataset columns to the master dataset schema
+    input: dataset and optional subset of columns to keep
+    output: dataset with schema dtypes
+    """
+    if columns is not None:
+        dataset = dataset[list(columns)]
+    casts = {}
+    for col in dataset.columns:
+        if col not in SCHEMA:
+            continue
+        if SCHEMA[col] == 'category':
+            casts[col] = dataset[col].astype('category')
+        else:
+            casts[col] = downcast(dataset[col], SCHEMA[col])
+    return dataset.assign(**casts) if casts else dataset
+
+
+##################Storage backends
+class CsvStore:
+    """master dataset stored as a plain csv file"""
+    extension = '.csv'
+
+    def exists(self, path):
+        return os.path.isfile(path)
+
+    def columns(self, path):
+        return pd.read_csv(path, nrows=0).columns.tolist()
+
+    def read(self, path, columns=None, start=0):
+        skiprows = range(1, start + 1) if start else None
+        return apply_schema(pd.read_csv(path, usecols=columns, skiprows=skiprows), columns)
+
+    def iter_chunks(self, path, columns=None, chunksize=100000):
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+            yield apply_schema(chunk, columns)
+
+    def write(self, dataset, path):
+        tmppath = path + '.tmp'
+        dataset.to_csv(tmppath, index=False)
+        os.replace(tmppath, path)
+
+    def append(self, dataset, path):
+        dataset.to_csv(path, index=False, header=False, mode='a')
+
+
+class NpyStore:
+    """master dataset stored as one raw binary file per column
+    columns are memory-mapped on read so only requested columns are loaded
+    string and categorical columns are dictionary-encoded as int32 codes and
+    read back as categoricals
+    rows can be appended without rewriting the existing data
+    """
+    extension = '.cols'
+    schema_file = '_schema.json'
+
+    def exists(self, path):
+        return os.path.isfile(os.path.join(path, self.schema_file))
+
+    def read_schema(self, path):
+        with open(os.path.join(path, self.schema_file), 'r') as f:
+            return json.load(f)
+
+    def write_schema(self, path, schema):
+        tmppath = os.path.join(path, self.schema_file + '.tmp')
+        with open(tmppath, 'w') as f:
+            json.dump(schema, f)
+        os.replace(tmppath, os.path.join(path, self.schema_file))
+
+    def read_dictionary(self, path, col):
+        with open(os.path.join(path, col + '.dict.json'), 'r') as f:
+            return json.load(f)
+
+    def write_dictionary(self, path, col, dictionary):
+        tmppath = os.path.join(path, col + '.dict.json.tmp')
+        with open(tmppath, 'w') as f:
+            json.dump(dictionary, f)
+        os.replace(tmppath, os.path.join(path, col + '.dict.json'))
+
+    def columns(self, path):
+        return list(self.read_schema(path)['columns'])
+
+    def encode(self, values, dictionary):
+        """map string values to codes, new values extend the dictionary"""
+        values = values.astype('category').cat.remove_unused_categories()
+        lookup = {value: code for code, value in enumerate(dictionary)}
+        for value in values.cat.categories:
+            if value not in lookup:
+                lookup[value] = len(dictionary)
+                dictionary.append(value)
+        # category codes to dictionary codes, missing values (-1) stay -1
+        mapping = np.array([lookup[value] for value in values.cat.categories] + [-1], dtype=np.int32)
+        return mapping[values.cat.codes.values]
+
+    def write_columns(self, dataset, path, schema, mode):
+        rows = schema['rows']
+        for col in dataset.columns:
+            info = schema['columns'][col]
+            if info['dictionary']:
+                dictionary = [] if mode == 'wb' else self.read_dictionary(path, col)
+                values = self.encode(dataset[col], dictionary)
+                self.write_dictionary(path, col, dictionary)
+            else:
+                values = np.ascontiguousarray(dataset[col].values, dtype=info['dtype'])
+            with open(os.path.join(path, col + '.bin'), mode) as f:
+                # drop bytes of an interrupted append before writing
+                f.truncate(rows * values.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(values.tobytes())
+
+    def read(self, path, columns=None, start=0, stop=None):
+        schema = self.read_schema(path)
+        rows = schema['rows']
+        data = {}
+        for col in columns or schema['columns']:
+            info = schema['columns'][col]
+            dtype = np.int32 if info['dictionary'] else np.dtype(info['dtype'])
+            if rows:
+                values = np.memmap(os.path.join(path, col + '.bin'), dtype=dtype,
+                                   mode='r', shape=(rows,))[start:stop]
+            else:
+                values = np.empty(0, dtype=dtype)
+            if info['dictionary']:
+                values = pd.Categorical.from_codes(np.asarray(values),
+                                                   categories=self.read_dictionary(path, col))
+            else:
+                values = np.array(values)
+            data[col] = values
+        return pd.DataFrame(data)
+
+    def iter_chunks(self, path, columns=None, chunksize=100000):
+        rows = self.read_schema(path)['rows']
+        for start in range(0, rows, chunksize):
+            yield self.read(path, columns, start, min(start + chunksize, rows))
+
+    def write(self, dataset, path):
+        tmppath = path + '.tmp'
+        shutil.rmtree(tmppath, ignore_errors=True)
+        os.makedirs(tmppath)
+        schema = {'rows': 0, 'columns': {}}
+        for col in dataset.columns:
+            dictionary = not pd.api.types.is_numeric_dtype(dataset[col])
+            schema['columns'][col] = {'dtype': 'int32' if dictionary else str(dataset[col].dtype),
+                                      'dictionary': bool(dictionary)}
+        self.write_columns(dataset, tmppath, schema, 'wb')
+        schema['rows'] = len(dataset)
+        self.write_schema(tmppath, schema)
+
+        # swap the new directory in place of the previous one
+        oldpath = path + '.old'
+        shutil.rmtree(oldpath, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, oldpath)
+        os.rename(tmppath, path)
+        shutil.rmtree(oldpath, ignore_errors=True)
+
+    def append(self, dataset, path):
+        schema = self.read_schema(path)
+        # a value needing a wider type than the stored column: rewrite all rows
+        for col, info in schema['columns'].items():
+            if not info['dictionary'] and not np.can_cast(dataset[col].dtype, info['dtype'], 'safe'):
+                self.write(apply_schema(pd.concat([self.read(path), dataset], ignore_index=True)), path)
+                return
+        self.write_columns(dataset[list(schema['columns'])], path, schema, 'ab')
+        # rows become visible to readers once the schema is updated
+        schema['rows'] += len(dataset)
+        self.write_schema(path, schema)
+
+
+class ParquetStore:
+    """master dataset stored as a parquet file (requires pyarrow)
+    appending rewrites the file
+    """
+    extension = '.parquet'
+
+    def __init__(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("parquet dataset format requires pyarrow, "
+                              "install it or use the 'npy' format")
+
+    def exists(self, path):
+        return os.path.isfile(path)
+
+    def columns(self, path):
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+
+    def read(self, path, columns=None, start=0):
+        dataset = apply_schema(pd.read_parquet(path, columns=columns))
+        return dataset.iloc[start:].reset_index(drop=True) if start else dataset
+
+    def iter_chunks(self, path, columns=None, chunksize=100000):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield apply_schema(batch.to_pandas())
+
+    def write(self, dataset, path):
+        tmppath = path + '.tmp'
+        dataset.to_parquet(tmppath, index=False)
+        os.replace(tmppath, path)
+
+    def append(self, dataset, path):
+        self.write(apply_schema(pd.concat([self.read(path), dataset], ignore_index=True)), path)
+
+
+STORES = {'csv': CsvStore, 'npy': NpyStore, 'parquet': ParquetStore}
+
+
+def register_store(name, store_class):
+    """make a new storage backend available under a dataset_format name"""
+    STORES[name] = store_class
+
+
+def get_store(name):
+    """instantiate the storage backend for a dataset_format name"""
+    if name not in STORES:
+        raise ValueError(f"unknown dataset format '{name}', "
+                         f"expected one of {sorted(STORES)}")
+    return STORES[name]()
+
+
+def store_for_path(path):
+    """instantiate the storage backend matching the extension of a dataset path
+    paths with an unknown extension are read as csv
+    """
+    path = path.rstrip('/\\')
+    for store_class in STORES.values():
+        if path.endswith(store_class.extension):
+            return store_class()
+    return CsvStore()
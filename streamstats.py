@@ -0,0 +1,205 @@
+import math
+import numpy as np
+
+
+##################Mergeable accumulators for single-pass statistics
+class Moments:
+    """running count, mean and variance (Welford / Chan et al. parallel update)
+    chunks are summarized with numpy then merged into the running state
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, values):
+        """add an array of non missing values"""
+        if len(values):
+            mean = float(values.mean())
+            self.merge(Moments(len(values), mean, float(((values - mean) ** 2).sum())))
+
+    def merge(self, other):
+        """combine with the moments of another chunk or worker"""
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    def std(self):
+        """sample standard deviation (ddof=1, as pandas)"""
+        if self.count < 2:
+            return float('nan')
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class QuantileSketch:
+    """mergeable quantile sketch
+    values are counted exactly while there are at most max_exact distinct values,
+    then folded into logarithmic buckets (DDSketch) so that any quantile is
+    returned within relative_accuracy of its true value
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_exact=4096):
+        self.relative_accuracy = relative_accuracy
+        self.max_exact = max_exact
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.exact = {}      # value -> count, None once folded into buckets
+        self.positive = {}   # bucket index -> count
+        self.negative = {}   # bucket index of abs(value) -> count
+        self.zeros = 0
+
+    def add_counts(self, target, keys, counts):
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            target[key] = target.get(key, 0) + count
+
+    def bucket(self, values):
+        return np.ceil(np.log(values) / math.log(self.gamma)).astype(np.int64)
+
+    def add_to_buckets(self, values, counts):
+        self.zeros += int(counts[values == 0].sum())
+        for sign, target in [(1, self.positive), (-1, self.negative)]:
+            mask = sign * values > 0
+            if mask.any():
+                keys, inverse = np.unique(self.bucket(sign * values[mask]), return_inverse=True)
+                self.add_counts(target, keys, np.bincount(inverse, weights=counts[mask]).astype(np.int64))
+
+    def fold(self):
+        """switch from exact counts to buckets"""
+        if self.exact:
+            self.add_to_buckets(np.array(list(self.exact), dtype=np.float64),
+                                np.array(list(self.exact.values()), dtype=np.int64))
+        self.exact = None
+
+    def update(self, values):
+        """add an array of non missing values"""
+        values, counts = np.unique(values, return_counts=True)
+        if self.exact is not None:
+            self.add_counts(self.exact, values, counts)
+            if len(self.exact) > self.max_exact:
+                self.fold()
+        else:
+            self.add_to_buckets(values.astype(np.float64), counts)
+
+    def merge(self, other):
+        """combine with the sketch of another chunk or worker"""
+        if self.exact is not None and other.exact is not None:
+            for value, count in other.exact.items():
+                self.exact[value] = self.exact.get(value, 0) + count
+            if len(self.exact) > self.max_exact:
+                self.fold()
+            return self
+
+        self.fold()
+        if other.exact is not None:
+            self.add_to_buckets(np.array(list(other.exact), dtype=np.float64),
+                                np.array(list(other.exact.values()), dtype=np.int64))
+        else:
+            for source, target in [(other.positive, self.positive), (other.negative, self.negative)]:
+                for key, count in source.items():
+                    target[key] = target.get(key, 0) + count
+            self.zeros += other.zeros
+        return self
+
+    def sorted_counts(self):
+        """(value, count) pairs in increasing value order"""
+        if self.exact is not None:
+            return sorted(self.exact.items())
+        # representative value of bucket i, within relative accuracy of (gamma^(i-1), gamma^i]
+        value = lambda i: 2 * self.gamma ** i / (self.gamma + 1)
+        pairs = [(-value(i), self.negative[i]) for i in sorted(self.negative, reverse=True)]
+        if self.zeros:
+            pairs.append((0.0, self.zeros))
+        pairs.extend((value(i), self.positive[i]) for i in sorted(self.positive))
+        return pairs
+
+    def quantile(self, q):
+        """value at quantile q, interpolated between closest ranks as pandas"""
+        pairs = self.sorted_counts()
+        total = sum(count for _, count in pairs)
+        if total == 0:
+            return float('nan')
+        rank = q * (total - 1)
+        lower, upper = math.floor(rank), math.ceil(rank)
+        lower_value = upper_value = None
+        seen = 0
+        for value, count in pairs:
+            seen += count
+            if lower_value is None and seen > lower:
+                lower_value = value
+            if seen > upper:
+                upper_value = value
+                break
+        return float(lower_value + (upper_value - lower_value) * (rank - lower))
+
+
+class ColumnProfile:
+    """single-pass profile of one column: NA count, moments and quantile sketch"""
+
+    def __init__(self, numeric, relative_accuracy=0.01):
+        self.numeric = numeric
+        self.rows = 0
+        self.na = 0
+        self.moments = Moments()
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, series):
+        isna = series.isna().values
+        self.rows += len(series)
+        self.na += int(isna.sum())
+        if self.numeric:
+            values = series.values[~isna].astype(np.float64)
+            self.moments.update(values)
+            self.sketch.update(values)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.na += other.na
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+
+class DatasetProfile:
+    """single-pass, mergeable profile of a dataset read chunk by chunk"""
+
+    def __init__(self, columns, numeric_columns, relative_accuracy=0.01):
+        self.columns = {col: ColumnProfile(col in numeric_columns, relative_accuracy)
+                            for col in columns}
+
+    def update(self, chunk):
+        """add a chunk of rows"""
+        for col, profile in self.columns.items():
+            profile.update(chunk[col])
+        return self
+
+    def merge(self, other):
+        """combine with the profile of other chunks or of another worker"""
+        for col, profile in self.columns.items():
+            profile.merge(other.columns[col])
+        return self
+
+    def result(self):
+        """statistics in the format of diagnostics.compute_statistics"""
+        statistics = {col: {'mean': profile.moments.mean if profile.moments.count else float('nan'),
+                            'median': profile.sketch.quantile(0.5),
+                            'std': profile.moments.std()}
+                        for col, profile in self.columns.items() if profile.numeric}
+        missing = {col: 100 * profile.na / profile.rows if profile.rows else float('nan')
+                        for col, profile in self.columns.items()}
+        return {'statistics': statistics, 'missing data': missing}
+
+
+def profile_chunks(chunks, columns, numeric_columns, relative_accuracy=0.01):
+    """profile a dataset in one pass over an iterator of chunks
+    input: iterator of dataframes, columns to profile and numeric columns among them
+    output: DatasetProfile
+    """
+    profile = DatasetProfile(columns, numeric_columns, relative_accuracy)
+    for chunk in chunks:
+        profile.update(chunk)
+    return profile
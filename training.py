@@ -1,9 +1,16 @@
 import pickle
 import os
-from sklearn.linear_model import LogisticRegression
+import time
 import json
+import importlib
+import numpy as np
 
-from ingestion import read_csv
+from ingestion import read_master, dataset_base
+from features import FEATURES, PREDICTORS, to_matrix, master_features, test_features
+from instrumentation import instrument, record_rows
+
+# sklearn and joblib are imported in the functions using them, so serving
+# processes importing bin_counts do not load them
 
 ###################Load config.json and get path variables
 with open('config.json','r') as f:
@@ -11,57 +18,291 @@ with open('config.json','r') as f:
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 model_path = os.path.join(config['output_model_path']) 
+test_data_path = os.path.join(config['test_data_path'])
+
+
+def bin_counts(values, edges):
+    """count values per bin, outer bins are open-ended"""
+    positions = np.searchsorted(edges, values, side='right')
+    return np.bincount(positions, minlength=len(edges) + 1)
+
+
+def reference_histograms(X, bins=10):
+    """
+    bin each predictor of the training data on its quantiles
+    the histograms are the reference distributions of drift detection
+    input: training predictor matrix, columns in PREDICTORS order, and number of bins
+    output: dict per predictor with inner bin edges and counts per bin
+    """
+    histograms = {}
+    for i, col in enumerate(PREDICTORS):
+        values = X[:, i][~np.isnan(X[:, i])]
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])) if len(values) else np.empty(0)
+        histograms[col] = {'edges': edges.tolist(),
+                           'counts': bin_counts(values, edges).tolist()}
+    return histograms
+
+
+def make_model():
+    """logistic regression used for a full refit"""
+    from sklearn.linear_model import LogisticRegression
+    return LogisticRegression(C=1.0, class_weight=None, dual=False, fit_intercept=True,
+                    intercept_scaling=1, l1_ratio=None, max_iter=100,
+                    multi_class='auto', n_jobs=None, penalty='l2',
+                    random_state=0, solver='liblinear', tol=0.0001, verbose=0,
+                    warm_start=False)
+
+
+# solvers able to start from the current coefficients, liblinear is not
+WARM_START_SOLVERS = ['lbfgs', 'newton-cg', 'newton-cholesky', 'sag', 'saga']
+
+
+def incremental_params(model):
+    """
+    parameters of the warm-started update of a model: its own parameters
+    (C, class_weight, penalty, tol, ...) with its solver; an l2 liblinear model,
+    such as the full refit model, is updated with lbfgs, which minimizes the same
+    penalized log loss but can warm start
+    input: current model
+    output: dict of LogisticRegression parameters, None when the model cannot be
+            updated incrementally (not a logistic regression, or a solver and
+            penalty without warm start)
+    """
+    from sklearn.linear_model import LogisticRegression
+    if type(model) is not LogisticRegression:
+        return None
+    params = model.get_params()
+    if params['solver'] == 'liblinear' and params['penalty'] == 'l2':
+        params.update(solver='lbfgs', dual=False)
+    elif params['solver'] not in WARM_START_SOLVERS:
+        return None
+    return params
+
+
+def fit_incremental(model, X, y, max_iter=None):
+    """
+    update a logistic regression on a batch, warm-started from its coefficients
+    the update keeps the parameters of the current model, see incremental_params
+    input: current model, batch to fit (new rows plus a sample of history) and
+           optional maximum number of iterations, the model's by default
+    output: updated model
+    """
+    from sklearn.linear_model import LogisticRegression
+    params = incremental_params(model)
+    if params is None:
+        raise ValueError(f'{type(model).__name__} with these parameters cannot be updated incrementally')
+    params['warm_start'] = True
+    if max_iter is not None:
+        params['max_iter'] = max_iter
+    updated = LogisticRegression(**params)
+    updated.coef_ = model.coef_.copy()
+    updated.intercept_ = model.intercept_.copy()
+    updated.fit(X, y)
+    updated.feature_names_in_ = np.asarray(PREDICTORS, dtype=object)
+    return updated
+
+
+def update_reservoir(reservoir, X, y, size, rng):
+    """
+    keep a uniform random sample of all rows seen so far (reservoir sampling)
+    input: reservoir dict (X, y, seen), new rows, reservoir size, random generator
+    output: updated reservoir
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    seen = reservoir['seen']
+    positions = seen + np.arange(len(X))
+
+    # fill the reservoir up to its size
+    fill = positions < size
+    sample_X = np.concatenate([reservoir['X'], X[fill]])
+    sample_y = np.concatenate([reservoir['y'], y[fill]])
+
+    # then replace a random slot with probability size / (position + 1)
+    candidates = np.where(~fill)[0]
+    slots = (rng.random(len(candidates)) * (positions[candidates] + 1)).astype(np.int64)
+    accepted = slots < size
+    sample_X[slots[accepted]] = X[candidates[accepted]]
+    sample_y[slots[accepted]] = y[candidates[accepted]]
 
-def segregate_dataset(dataset):
+    return {'X': sample_X, 'y': sample_y, 'seen': seen + len(X)}
+
+
+def read_training_state():
     """
-    Eliminate features not used
-    segregate the dataset into X and y
-    input: dataset to segregate
-    output: X and y
+    read the incremental training state and history sample
+    output: state dict (rows_trained, incremental_runs) and reservoir, None if missing
     """
+    statepath = os.path.join(model_path, 'trainingstate.json')
+    reservoirpath = os.path.join(model_path, 'trainingreservoir.npz')
+    if not (os.path.exists(statepath) and os.path.exists(reservoirpath)):
+        return None, None
+    with open(statepath, 'r') as f:
+        state = json.load(f)
+    with np.load(reservoirpath) as data:
+        reservoir = {'X': data['X'], 'y': data['y'], 'seen': int(data['seen'])}
+    return state, reservoir
+
+
+def write_training_state(state, reservoir):
+    """save the incremental training state and history sample"""
+    reservoirpath = os.path.join(model_path, 'trainingreservoir.npz')
+    with open(reservoirpath + '.tmp', 'wb') as f:
+        np.savez(f, X=reservoir['X'], y=reservoir['y'], seen=reservoir['seen'])
+    os.replace(reservoirpath + '.tmp', reservoirpath)
+
+    statepath = os.path.join(model_path, 'trainingstate.json')
+    with open(statepath + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(statepath + '.tmp', statepath)
+
+
+#################Parallel search of candidate models
+# estimator families available to candidate configurations
+ESTIMATORS = {'logistic_regression': 'sklearn.linear_model.LogisticRegression',
+              'random_forest': 'sklearn.ensemble.RandomForestClassifier'}
+
+# candidates searched when config.json has no "candidates" entry
+DEFAULT_CANDIDATES = (
+    [{'estimator': 'logistic_regression',
+      'params': {'C': C, 'solver': solver, 'class_weight': class_weight,
+                 'max_iter': 1000, 'random_state': 0}}
+        for C in [1.0, 0.01, 0.1, 10.0]
+        for solver in ['liblinear', 'lbfgs']
+        for class_weight in [None, 'balanced']]
+    + [{'estimator': 'random_forest',
+        'params': {'n_estimators': 100, 'max_depth': max_depth,
+                   'class_weight': class_weight, 'n_jobs': 1, 'random_state': 0}}
+        for max_depth in [3, None]
+        for class_weight in [None, 'balanced']])
 
-    # eliminate features not used for training
-    features = ['lastmonth_activity','lastyear_activity','number_of_employees','exited']
-    dataset = dataset[features]
 
-    # data segregation
-    predictors = features[:-1]
-    target_variable = 'exited'
-    X = dataset[predictors]
-    y = dataset[target_variable]
+def fit_candidate(candidate, X, y, X_test, y_test):
+    """
+    fit one candidate configuration and score it on the test set
+    runs in a worker process, X and y are memory-mapped read-only arrays
+    input: candidate configuration, training and test arrays
+    output: fitted model and its result record
+    """
+    from sklearn import metrics
+    module, name = ESTIMATORS[candidate['estimator']].rsplit('.', 1)
+    model = getattr(importlib.import_module(module), name)(**candidate['params'])
+    start = time.perf_counter()
+    model.fit(X, y)
+    fit_time = time.perf_counter() - start
+    score = metrics.f1_score(y_test, model.predict(X_test))
+    return model, dict(candidate, f1=score, fit_time=fit_time)
+
+
+def search_candidates(X, y, n_jobs=None):
+    """
+    fit candidate configurations in parallel and pick the best on the test set
+    the training matrix is memory-mapped once and shared by all workers
+    input: training predictor matrix and target, number of parallel jobs
+    output: champion model and list of candidate results, champion first
+    """
+    from joblib import Parallel, delayed
+    candidates = config.get('candidates') or DEFAULT_CANDIDATES
+    n_jobs = n_jobs or config.get('training_n_jobs', -1)
+
+    X_test, y_test = test_features()
 
-    return X,y
+    # the cached feature matrices are memory-mapped files, workers map them
+    # directly; other arrays above 1MB are dumped once to a shared file
+    results = Parallel(n_jobs=n_jobs, max_nbytes='1M', mmap_mode='r')(
+        delayed(fit_candidate)(candidate, X, y, X_test, y_test)
+            for candidate in candidates)
+
+    # best f1, the earliest candidate wins ties
+    ranking = sorted(range(len(results)), key=lambda i: (-results[i][1]['f1'], i))
+    champion = results[ranking[0]][0]
+    # fitted on arrays: record predictor names as a dataframe fit would
+    champion.feature_names_in_ = np.asarray(PREDICTORS, dtype=object)
+
+    return champion, [results[i][1] for i in ranking]
 
 
 #################Function for training the model
-def train_model():
+@instrument('training')
+def train_model(mode=None):
     """
     Train a logistic regression model for churn classification
-    input: None
+    - full mode fits a new model on the entire master dataset
+    - search mode fits candidate configurations in parallel on the entire master
+      dataset and keeps the best one on the test data (see search_candidates)
+    - incremental mode updates the current model from the rows ingested since
+      the last training, plus a bounded random sample of older rows
+      (training_reservoir_size), keeping the parameters of the current model;
+      every full_refit_every runs, when the current model cannot be warm-started
+      (see incremental_params) or when the master dataset was rewritten since the
+      last training (see ingestion.dataset_base), the last full refit mode is run again
+    input: mode, 'full', 'search' or 'incremental', training_mode from config.json by default
     output: trained model saved to disk
     """
-    
-    #use this logistic regression for training
-    model = LogisticRegression(C=1.0, class_weight=None, dual=False, fit_intercept=True,
-                    intercept_scaling=1, l1_ratio=None, max_iter=100,
-                    multi_class='auto', n_jobs=None, penalty='l2',
-                    random_state=0, solver='liblinear', tol=0.0001, verbose=0,
-                    warm_start=False)
-    
-    # import dataset
-    filepath = os.path.join(dataset_csv_path, "finaldata.csv")
-    dataset = read_csv(filepath)
-
-    X,y = segregate_dataset(dataset)
-    
-    # fit the logistic regression to your data
-    model.fit(X,y)
-    
+    mode = mode or config.get('training_mode', 'full')
+    reservoir_size = config.get('training_reservoir_size', 100000)
+    rng = np.random.default_rng()
+
+    modelpath = os.path.join(model_path,'trainedmodel.pkl')
+    state, reservoir = read_training_state()
+    model = None
+    if mode == 'incremental' and state is not None and os.path.exists(modelpath):
+        with open(modelpath, 'rb') as f:
+            model = pickle.load(f)
+    if mode == 'incremental' and (state is None or model is None
+            or incremental_params(model) is None
+            or state.get('dataset_base') != dataset_base()
+            or state['incremental_runs'] + 1 >= config.get('full_refit_every', 10)):
+        mode = state.get('refit_mode', 'full') if state else 'full'
+
+    if mode in ['full', 'search']:
+        # feature matrix of the master dataset, built once per dataset version
+        X,y = master_features()
+        record_rows(len(X))
+
+        if mode == 'search':
+            model, results = search_candidates(X, y)
+            with open(os.path.join(model_path, 'candidates.json'), 'w') as f:
+                json.dump(results, f, indent=1)
+        else:
+            #use this logistic regression for training
+            model = make_model()
+            # fit the logistic regression to your data
+            model.fit(X,y)
+            # fitted on arrays: record predictor names as a dataframe fit would
+            model.feature_names_in_ = np.asarray(PREDICTORS, dtype=object)
+
+        state = {'rows_trained': len(X), 'incremental_runs': 0,
+                 'refit_mode': mode,
+                 'dataset_base': dataset_base()}
+        reservoir = {'X': np.empty((0, X.shape[1])), 'y': np.empty(0, dtype=y.dtype), 'seen': 0}
+        reservoir = update_reservoir(reservoir, X, y, reservoir_size, rng)
+    else:
+        # import rows ingested since the last training only
+        X_new, y_new = to_matrix(read_master(FEATURES, start=state['rows_trained']))
+
+        # fit on the new rows and the sample of history
+        X = np.concatenate([reservoir['X'], X_new])
+        y = np.concatenate([reservoir['y'], y_new])
+        record_rows(len(X))
+        model = fit_incremental(model, X, y)
+
+        state = dict(state, rows_trained=state['rows_trained'] + len(X_new),
+                     incremental_runs=state['incremental_runs'] + 1)
+        reservoir = update_reservoir(reservoir, X_new, y_new, reservoir_size, rng)
+
     # write the trained model to your workspace in a file called trainedmodel.pkl
-    savingpath = os.path.join(model_path,'trainedmodel.pkl')
-    with open(savingpath, 'wb') as f:
+    # write to a temporary file first so readers never see a partial pickle
+    with open(modelpath + '.tmp', 'wb') as f:
         pickle.dump(model, f)
+    os.replace(modelpath + '.tmp', modelpath)
+    write_training_state(state, reservoir)
+
+    # keep the training distribution of each predictor for drift detection
+    savingpath = os.path.join(model_path,'referencehistograms.json')
+    with open(savingpath, 'w') as f:
+        json.dump(reference_histograms(X), f)
 
 
 if __name__ == '__main__':
-    train_model()
\ No newline at end of file
+    train_model()